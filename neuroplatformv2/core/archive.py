@@ -0,0 +1,198 @@
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Tuple, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from ..utils.constants import DB_IMMUTABLE_DELAY
+
+Interval = Tuple[datetime, datetime]
+
+# Hive partitions of the archive: hour of the sample and channel
+PARTITIONING = ds.partitioning(
+    pa.schema([("hour", pa.int64()), ("channel", pa.int64())]), flavor="hive"
+)
+
+
+def as_utc(date: datetime) -> datetime:
+    """Query dates without timezone are in UTC (see the Flux range)"""
+    if date.tzinfo is None:
+        return date.replace(tzinfo=timezone.utc)
+    return date.astimezone(timezone.utc)
+
+
+def merge_intervals(intervals: List[Interval]) -> List[Interval]:
+    """Merge overlapping or adjacent [start, stop) intervals"""
+    merged = []
+    for start, stop in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def missing_intervals(
+    covered: List[Interval], start: datetime, stop: datetime
+) -> List[Interval]:
+    """Sub-ranges of [start, stop) not in the merged covered intervals"""
+    missing = []
+    cursor = start
+    for cov_start, cov_stop in covered:
+        if cov_stop <= cursor:
+            continue
+        if cov_start >= stop:
+            break
+        if cov_start > cursor:
+            missing.append((cursor, cov_start))
+        cursor = max(cursor, cov_stop)
+    if cursor < stop:
+        missing.append((cursor, stop))
+    return missing
+
+
+def is_immutable(stop: datetime) -> bool:
+    """Data older than DB_IMMUTABLE_DELAY seconds will not change anymore"""
+    limit = datetime.now(timezone.utc) - timedelta(seconds=DB_IMMUTABLE_DELAY)
+    return as_utc(stop) <= limit
+
+
+class SpikeArchive:
+    """Local Parquet archive of past spike query results.
+
+    Results are stored per bucket and key (electrode index or fsname), partitioned
+    by hour and channel: `<root>/<bucket>/<key>/hour=YYYYMMDDHH/channel=N/*.parquet`.
+    The time ranges already exported are kept in `_coverage.json` next to the data,
+    so only the uncovered ranges are queried from the database. The data is written
+    before the coverage (replaced atomically): after a crash in between, the range
+    is exported again and the duplicate rows are dropped on read.
+    """
+
+    def __init__(self, root: str):
+        self._root = root
+        self._fs = fs.LocalFileSystem(use_mmap=True)
+
+    def _path(self, bucket: str, key: Union[int, str]) -> str:
+        return os.path.join(self._root, bucket, str(key))
+
+    def _coverage_path(self, bucket: str, key: Union[int, str]) -> str:
+        return os.path.join(self._path(bucket, key), "_coverage.json")
+
+    def coverage(self, bucket: str, key: Union[int, str]) -> List[Interval]:
+        """Time ranges already exported to the archive"""
+        path = self._coverage_path(bucket, key)
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            data = json.load(f)
+        return [
+            (datetime.fromisoformat(start), datetime.fromisoformat(stop))
+            for start, stop in data
+        ]
+
+    def _save_coverage(
+        self, bucket: str, key: Union[int, str], intervals: List[Interval]
+    ):
+        path = self._coverage_path(bucket, key)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                [[start.isoformat(), stop.isoformat()] for start, stop in intervals], f
+            )
+        os.replace(tmp, path)
+
+    def missing(
+        self, bucket: str, key: Union[int, str], start: datetime, stop: datetime
+    ) -> List[Interval]:
+        """Time ranges of [start, stop) not yet in the archive"""
+        return missing_intervals(
+            self.coverage(bucket, key), as_utc(start), as_utc(stop)
+        )
+
+    def write(
+        self,
+        bucket: str,
+        key: Union[int, str],
+        start: datetime,
+        stop: datetime,
+        df: pd.DataFrame,
+    ):
+        """Export the query result of [start, stop) to the archive"""
+        path = self._path(bucket, key)
+        os.makedirs(path, exist_ok=True)
+        if len(df.index) > 0:
+            df = df.copy()
+            df["Time"] = pd.to_datetime(df["Time"], utc=True)
+            df["hour"] = df["Time"].dt.strftime("%Y%m%d%H").astype("int64")
+            df = df.astype({"channel": "int64"}).sort_values(by="Time")
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            pq.write_to_dataset(
+                table,
+                root_path=path,
+                partitioning=PARTITIONING,
+                basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                filesystem=self._fs,
+            )
+
+        intervals = self.coverage(bucket, key) + [(as_utc(start), as_utc(stop))]
+        self._save_coverage(bucket, key, merge_intervals(intervals))
+
+    def read(
+        self, bucket: str, key: Union[int, str], start: datetime, stop: datetime
+    ) -> pd.DataFrame:
+        """Read [start, stop) from the archive.
+        Files are memory-mapped and the hour/time filters are pushed down to the scan.
+        Rows exported twice are returned once.
+        """
+        path = self._path(bucket, key)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        start, stop = as_utc(start), as_utc(stop)
+        dataset = ds.dataset(
+            path,
+            format="parquet",
+            partitioning=PARTITIONING,
+            filesystem=self._fs,
+            exclude_invalid_files=True,
+        )
+        if not dataset.files:
+            return pd.DataFrame()
+
+        hour_start = int(start.strftime("%Y%m%d%H"))
+        hour_stop = int(stop.strftime("%Y%m%d%H"))
+        ts_type = dataset.schema.field("Time").type
+        predicate = (
+            (ds.field("hour") >= hour_start)
+            & (ds.field("hour") <= hour_stop)
+            & (ds.field("Time") >= pa.scalar(pd.Timestamp(start), type=ts_type))
+            & (ds.field("Time") < pa.scalar(pd.Timestamp(stop), type=ts_type))
+        )
+        table = dataset.to_table(filter=predicate)
+        df = table.to_pandas().drop(columns=["hour"])
+        columns = ["Time", "channel"] + [
+            c for c in df.columns if c not in ("Time", "channel")
+        ]
+        df = df[columns].drop_duplicates()
+        return df.sort_values(by="Time", ignore_index=True)
+
+    def fetch(
+        self,
+        bucket: str,
+        key: Union[int, str],
+        start: datetime,
+        stop: datetime,
+        query: Callable[[datetime, datetime], pd.DataFrame],
+    ) -> pd.DataFrame:
+        """Serve [start, stop) from the archive, querying only the uncovered ranges.
+        :type query: Callable
+            query(start, stop) of the database for the bucket and key
+        """
+        for gap_start, gap_stop in self.missing(bucket, key, start, stop):
+            self.write(bucket, key, gap_start, gap_stop, query(gap_start, gap_stop))
+        return self.read(bucket, key, start, stop)
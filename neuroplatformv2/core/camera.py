@@ -1,20 +1,34 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Union
+from typing import Dict, List, Optional, Set, Union
 
 import cv2
 import numpy as np
 import pandas as pd
-import requests
 from dateutil import parser
 
-from ..utils.constants import CAMERA_IP, CAMERA_PORT
+from ..utils.constants import CAMERA_DECODE_WORKERS, CAMERA_IP, CAMERA_PORT
 from ..utils.enumerations import MEA
 from ..utils.exceptions import CameraReadingError
 from ..utils.schemas import (
     CameraCaptureRequest,
     CameraFromRequest,
+    CameraImagesRequest,
     CameraListImagesRequest,
+    CameraNewImagesRequest,
 )
+from .http import HTTPClient, get_http_client
+from .image_cache import ImageCache, get_image_cache
+
+# cv2 releases the GIL while decoding, so the images are decoded in threads
+_decoder = ThreadPoolExecutor(max_workers=CAMERA_DECODE_WORKERS)
+
+# Local index of the images listed by list_new_images (one frame per call), last
+# date seen and ids of the images at that date per MEA
+_image_index: Dict[MEA, List[pd.DataFrame]] = {}
+_last_seen: Dict[MEA, datetime] = {}
+_last_ids: Dict[MEA, Set[str]] = {}
 
 # MARK: Main business logic
 
@@ -24,31 +38,77 @@ class CameraController:
     CameraController class to access and take picture of MEA
     """
 
-    def __init__(self, mea: MEA):
+    def __init__(
+        self,
+        mea: MEA,
+        client: Optional[HTTPClient] = None,
+        cache: Optional[ImageCache] = None,
+    ):
         self._mea = mea
+        self._client = client or get_http_client()
+        self._cache = cache or get_image_cache()
+
+    @staticmethod
+    def _decode(jpg_original: bytes, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Decode a JPEG to RGB
+        :type out: np.ndarray, optional
+            Array of the image shape to write the image into
+        """
+        jpg_as_np = np.frombuffer(jpg_original, dtype=np.uint8)
+        img = cv2.imdecode(jpg_as_np, flags=cv2.IMREAD_COLOR)
+        if out is not None and img.shape != out.shape:
+            raise CameraReadingError(
+                f"Image shape {img.shape} differs from the series shape {out.shape}"
+            )
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=out)
+        return img
 
-    def _image_from(self, img_id: str) -> Optional[np.ndarray]:
+    async def _fetch_jpeg(self, img_id: str, kind: str = "image") -> bytes:
         """
-        Get image with the ID
+        Download the JPEG of an image
         :type img_id: str
-
-        :return:
-            np.array: image in RGB
+        :type kind: str
+            image or thumb
         """
-        r = requests.get(f"http://{CAMERA_IP}:{CAMERA_PORT}/image/{img_id}")
+        if self._cache is not None:
+            content = self._cache.get_jpeg(kind, img_id)
+            if content is not None:
+                return content
+        r = await self._client.get(f"http://{CAMERA_IP}:{CAMERA_PORT}/{kind}/{img_id}")
         if r.status_code == 200:
-            jpg_original = r.content
-            jpg_as_np = np.frombuffer(jpg_original, dtype=np.uint8)
-            img = cv2.imdecode(jpg_as_np, flags=cv2.IMREAD_COLOR)
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            return img
+            if self._cache is not None:
+                self._cache.put_jpeg(kind, img_id, r.content)
+            return r.content
         else:
             raise CameraReadingError(
                 f"Status code: {r.status_code}, Image not available"
             )
 
+    async def _cached_frame(self, img_id: str, kind: str) -> np.ndarray:
+        """
+        Get a decoded image, from the image cache if enabled.
+        Cached frames are read-only memory maps.
+        """
+        if self._cache is None:
+            return self._decode(await self._fetch_jpeg(img_id, kind))
+        img = self._cache.get_frame(kind, img_id)
+        if img is None:
+            img = self._decode(await self._fetch_jpeg(img_id, kind))
+            img = self._cache.put_frame(kind, img_id, img)
+        return img
+
+    async def _image_from(self, img_id: str) -> Optional[np.ndarray]:
+        """
+        Get image with the ID
+        :type img_id: str
+
+        :return:
+            np.array: image in RGB
+        """
+        return await self._cached_frame(img_id, "image")
+
     @classmethod
-    def image_from(cls, req: CameraFromRequest) -> Optional[np.ndarray]:
+    async def image_from(cls, req: CameraFromRequest) -> Optional[np.ndarray]:
         """
         Get image with the ID
         :type req: CameraFromRequest
@@ -56,20 +116,21 @@ class CameraController:
         :return:
             np.array: image in RGB
         """
-        r = requests.get(f"http://{CAMERA_IP}:{CAMERA_PORT}/image/{req.img_id}")
-        if r.status_code == 200:
-            jpg_original = r.content
-            jpg_as_np = np.frombuffer(jpg_original, dtype=np.uint8)
-            img = cv2.imdecode(jpg_as_np, flags=cv2.IMREAD_COLOR)
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            return img
-        else:
-            raise CameraReadingError(
-                f"Status code: {r.status_code}, Image not available"
-            )
+        controller = cls(req.mea)
+        return await controller._image_from(req.img_id)
+
+    async def _thumbnail_from(self, img_id: str) -> Optional[np.ndarray]:
+        """
+        Get thumbnail with the ID.
+        :type img_id: str
+
+        :return:
+            np.array: image in RGB
+        """
+        return await self._cached_frame(img_id, "thumb")
 
     @classmethod
-    def thumbnail_from(cls, req: CameraFromRequest) -> Optional[np.ndarray]:
+    async def thumbnail_from(cls, req: CameraFromRequest) -> Optional[np.ndarray]:
         """
         Get thumbnail with the ID.
         :type req: CameraFromRequest
@@ -77,17 +138,60 @@ class CameraController:
         :return:
             np.array: image in RGB
         """
-        r = requests.get(f"http://{CAMERA_IP}:{CAMERA_PORT}/thumb/{req.img_id}")
-        if r.status_code == 200:
-            jpg_original = r.content
-            jpg_as_np = np.frombuffer(jpg_original, dtype=np.uint8)
-            img = cv2.imdecode(jpg_as_np, flags=cv2.IMREAD_COLOR)
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            return img
+        controller = cls(req.mea)
+        return await controller._thumbnail_from(req.img_id)
+
+    async def _images_from(
+        self, img_ids: List[str], thumbnail: bool = False
+    ) -> np.ndarray:
+        """
+        Get several images concurrently. The images are decoded in a thread pool
+        into one preallocated array.
+        :type img_ids: List[str]
+        :type thumbnail: bool
+            Get the thumbnails instead of the images
+
+        :return:
+            np.array: (N, H, W, 3) images in RGB
+        """
+        kind = "thumb" if thumbnail else "image"
+        contents = await asyncio.gather(
+            *[self._fetch_jpeg(img_id, kind) for img_id in img_ids]
+        )
+        if not contents:
+            return np.empty((0, 0, 0, 3), dtype=np.uint8)
+
+        loop = asyncio.get_running_loop()
+        first = await loop.run_in_executor(_decoder, self._decode, contents[0])
+        images = np.empty((len(contents),) + first.shape, dtype=np.uint8)
+        images[0] = first
+        await asyncio.gather(
+            *[
+                loop.run_in_executor(_decoder, self._decode, content, images[i])
+                for i, content in enumerate(contents)
+                if i > 0
+            ]
+        )
+        return images
+
+    @classmethod
+    async def images_from(
+        cls, req: Union[CameraImagesRequest, CameraListImagesRequest]
+    ) -> np.ndarray:
+        """
+        Get several images concurrently, by ID or for all the images taken during an interval
+        :type req: CameraImagesRequest or CameraListImagesRequest
+
+        :return:
+            np.array: (N, H, W, 3) images in RGB
+        """
+        controller = cls(req.mea)
+        if isinstance(req, CameraListImagesRequest):
+            df = await controller._list_images(req.start_date, req.end_date)
+            img_ids = list(df["id"]) if len(df.index) > 0 else []
         else:
-            raise CameraReadingError(
-                f"Status code: {r.status_code}, Image not available"
-            )
+            img_ids = req.img_ids
+        return await controller._images_from(img_ids)
 
     async def _list_images(
         self, start_date: Union[str, datetime], end_date: Union[str, datetime]
@@ -110,27 +214,61 @@ class CameraController:
         payload = {"start": start_date.isoformat(), "end": end_date.isoformat()}
 
         # Making the POST request
-        response = requests.post(
+        response = await self._client.post(
             f"http://{CAMERA_IP}:{CAMERA_PORT}/listimage", json=payload
         )
 
         # Handle possible HTTP errors
         response.raise_for_status()
 
-        # Convert response JSON to list of ImageData
-        data = response.json()
+        # Convert response JSON to a DataFrame of the images of the MEA
+        df = pd.DataFrame(data=response.json())
+        if len(df.index) == 0:
+            return pd.DataFrame(columns=["id", "date"])
 
-        index_mea = self._mea.value
+        # Images of MEA One have no index
+        index = df["index"] if "index" in df else pd.Series(None, index=df.index)
         if self._mea == MEA.One:
-            index_mea = None
+            mask = index.isna()
+        else:
+            mask = index == self._mea.value
+        df = df.loc[mask, ["id", "date"]].reset_index(drop=True)
+        df["date"] = pd.to_datetime(df["date"])
+
+        return df
 
-        images = []
-        for item in data:
-            index = item.get("index")
-            if index == index_mea:
-                images.append({"id": item["id"], "date": parser.parse(item["date"])})
+    async def _list_new_images(self, since: Union[str, datetime]) -> pd.DataFrame:
+        """
+        List the images taken since the last call for this MEA.
+        Only the images newer than the last one seen are requested, and they are
+        added to the local index of the MEA.
+        :type since: datetime
+            Start of the first listing of the MEA
 
-        return pd.DataFrame(data=images)
+        :return pd.DataFrame of the new images
+        """
+        last_seen = _last_seen.get(self._mea)
+        start_date = since if last_seen is None else last_seen
+        if isinstance(start_date, str):
+            start_date = datetime.fromisoformat(start_date)
+        end_date = datetime.now(start_date.tzinfo)
+
+        df = await self._list_images(start_date, end_date)
+        if last_seen is not None:
+            # The listing includes the images at the last date seen, already listed
+            df = df[(df["date"] >= last_seen) & ~df["id"].isin(_last_ids[self._mea])]
+        if len(df.index) == 0:
+            return df.reset_index(drop=True)
+
+        df = df.sort_values(by="date", ignore_index=True)
+        _image_index.setdefault(self._mea, []).append(df)
+        last = df["date"].iloc[-1]
+        ids = set(df.loc[df["date"] == last, "id"])
+        if last_seen is not None and last == last_seen:
+            ids |= _last_ids[self._mea]
+        _last_seen[self._mea] = last.to_pydatetime()
+        _last_ids[self._mea] = ids
+        return df
 
     # MARK: Public methods/class methods
 
@@ -139,45 +277,83 @@ class CameraController:
         controller = cls(req.mea)
         return await controller._list_images(req.start_date, req.end_date)
 
+    @classmethod
+    async def list_new_images(cls, req: CameraNewImagesRequest) -> pd.DataFrame:
+        controller = cls(req.mea)
+        return await controller._list_new_images(req.since)
+
+    @classmethod
+    def image_index(cls, mea: MEA) -> pd.DataFrame:
+        """All the images of the MEA listed by list_new_images"""
+        frames = _image_index.get(mea)
+        if not frames:
+            return pd.DataFrame(columns=["id", "date"])
+        return pd.concat(frames, ignore_index=True)
+
+    async def _image_info(self, img_id: str) -> pd.DataFrame:
+        """
+        Get id and date of an image
+
+        :return pd.DataFrame
+        """
+        r = await self._client.get(
+            f"http://{CAMERA_IP}:{CAMERA_PORT}/imageinfo/{img_id}"
+        )
+        r.raise_for_status()
+        date = r.json()["date"]
+
+        return pd.DataFrame(data=[{"id": img_id, "date": parser.parse(date)}])
+
     async def _last_capture(self):
         """
         Get last capture of a MEA
 
         :return pd.DataFrame
         """
-        r = requests.get(f"http://{CAMERA_IP}:{CAMERA_PORT}/lastcapture")
+        r = await self._client.get(f"http://{CAMERA_IP}:{CAMERA_PORT}/lastcapture")
         r.raise_for_status()
         data = r.json()
         index_img = data[self._mea.value]
 
-        r = requests.get(
-            f"http://{CAMERA_IP}:{CAMERA_PORT}/imageinfo/{index_img['_id']}"
-        )
-        r.raise_for_status()
-        data = r.json()
-        date = data["date"]
-
-        return pd.DataFrame(data=[{"id": index_img["_id"], "date": parser.parse(date)}])
+        return await self._image_info(index_img["_id"])
 
     @classmethod
     async def last_capture(cls, req: CameraCaptureRequest) -> pd.DataFrame:
         controller = cls(req.mea)
         return await controller._last_capture()
 
+    @classmethod
+    async def last_captures(cls, meas: Optional[List[MEA]] = None) -> pd.DataFrame:
+        """
+        Get last capture of several MEAs (all by default) concurrently
+
+        :return pd.DataFrame with mea, id and date columns
+        """
+        meas = list(MEA) if meas is None else meas
+        client = get_http_client()
+        r = await client.get(f"http://{CAMERA_IP}:{CAMERA_PORT}/lastcapture")
+        r.raise_for_status()
+        data = r.json()
+
+        infos = await asyncio.gather(
+            *[cls(mea, client)._image_info(data[mea.value]["_id"]) for mea in meas]
+        )
+        df = pd.concat(infos, ignore_index=True)
+        df.insert(0, "mea", meas)
+        return df
+
     async def _capture(self):
         """
         Capture MEA
 
         :return img: np.array
         """
-        r = requests.get(f"http://172.30.1.221:5000/capture_cam/{self._mea.value}")
+        r = await self._client.get(
+            f"http://172.30.1.221:5000/capture_cam/{self._mea.value}"
+        )
         r.raise_for_status()
 
-        jpg_original = r.content
-        jpg_as_np = np.frombuffer(jpg_original, dtype=np.uint8)
-        img = cv2.imdecode(jpg_as_np, flags=cv2.IMREAD_COLOR)
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        return img
+        return self._decode(r.content)
 
     @classmethod
     async def capture(cls, req: CameraCaptureRequest) -> np.ndarray:
@@ -188,23 +364,33 @@ class CameraController:
 # MARK: Functions for tools
 
 
-def image_from(req: CameraFromRequest):
-    validator = CameraFromRequest(img_id=req.img_id)
-    return CameraController.image_from(validator)
+async def image_from(req: CameraFromRequest):
+    validator = CameraFromRequest(mea=req.mea, img_id=req.img_id)
+    return await CameraController.image_from(validator)
+
 
+async def thumbnail_from(req: CameraFromRequest):
+    validator = CameraFromRequest(mea=req.mea, img_id=req.img_id)
+    return await CameraController.thumbnail_from(validator)
 
-def thumbnail_from(req: CameraFromRequest):
-    validator = CameraFromRequest(img_id=req.img_id)
-    return CameraController.thumbnail_from(validator)
+
+async def images_from(req: CameraImagesRequest) -> np.ndarray:
+    validator = CameraImagesRequest(mea=req.mea, img_ids=req.img_ids)
+    return await CameraController.images_from(validator)
 
 
 async def list_images(req: CameraListImagesRequest) -> pd.DataFrame:
     validator = CameraListImagesRequest(
-        mea=req.mea, start_date=req.start_date, end_data=req.end_date
+        mea=req.mea, start_date=req.start_date, end_date=req.end_date
     )
     return await CameraController.list_images(validator)
 
 
+async def list_new_images(req: CameraNewImagesRequest) -> pd.DataFrame:
+    validator = CameraNewImagesRequest(mea=req.mea, since=req.since)
+    return await CameraController.list_new_images(validator)
+
+
 async def last_capture(req: CameraCaptureRequest) -> pd.DataFrame:
     validator = CameraCaptureRequest(mea=req.mea)
     return await CameraController.last_capture(validator)
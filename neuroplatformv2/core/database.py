@@ -1,36 +1,100 @@
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Callable, List, Optional
 
 import pandas as pd
 from influxdb_client import InfluxDBClient
 
-from ..utils.constants import DB_IP, DB_PORT, DB_TIMEOUT, DB_TOKEN
+from ..utils.constants import (
+    ARCHIVE_DIR,
+    DB_IP,
+    DB_PORT,
+    DB_TIMEOUT,
+    DB_TOKEN,
+    QUERY_CACHE_DIR,
+    QUERY_CACHE_SIZE,
+)
+from ..utils.enumerations import AggregateFn
 from ..utils.exceptions import DatabaseConnectionError, DatabaseQueryError
 from ..utils.schemas import (
+    DataPage,
     RawSpikeQuery,
+    RawSpikeSummaryQuery,
+    SpikeAggregateQuery,
     SpikeCountQuery,
+    SpikeCountSummaryQuery,
     SpikeEventQuery,
+    SpikeEventSummaryQuery,
+    TaggedTriggersQuery,
     TriggersQuery,
+    TriggersSummaryQuery,
+)
+from .archive import SpikeArchive, is_immutable
+from .query_cache import QueryCache
+from .stream import stream_query
+from .summary import Aggregator, summarize
+
+# Shared by all the controllers, as a controller is created for each query
+_query_cache = (
+    QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_DIR or None)
+    if QUERY_CACHE_SIZE > 0
+    else None
 )
 
 
 class DatabaseController:
-    """Database class to access recorded data"""
+    """Database class to access recorded data.
+    If ARCHIVE_DIR is set, past spike windows are served from the local archive.
+    Other past windows are served from the query cache.
+    """
 
-    def __init__(self):
+    def __init__(
+        self,
+        archive: Optional[SpikeArchive] = None,
+        cache: Optional[QueryCache] = None,
+    ):
         self._token = DB_TOKEN
         self._url = f"http://{DB_IP}:{DB_PORT}"
+        if archive is None and ARCHIVE_DIR:
+            archive = SpikeArchive(ARCHIVE_DIR)
+        self._archive = archive
+        self._cache = cache if cache is not None else _query_cache
+        self._client: Optional[InfluxDBClient] = None
 
     def _connect_to_db(self):
+        """Query API of the client, created on first use and reused"""
         try:
-            client_read = InfluxDBClient(
-                url=self._url, token=self._token, timeout=DB_TIMEOUT
-            )
-            return client_read.query_api()
+            if self._client is None:
+                self._client = InfluxDBClient(
+                    url=self._url, token=self._token, timeout=DB_TIMEOUT
+                )
+            return self._client.query_api()
         except DatabaseConnectionError as e:
             raise DatabaseConnectionError(f"Failed to connecting to db: {str(e)}")
 
-    async def _get_spike_event(
+    def close(self):
+        """Close the connections of the client"""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def _cached(
+        self,
+        bucket: str,
+        filter: str,
+        start: datetime,
+        stop: datetime,
+        query: Callable[[datetime, datetime], pd.DataFrame],
+        time_column: str = "Time",
+        sort_by: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """Run the query through the cache if the window is immutable"""
+        if self._cache is not None and is_immutable(stop):
+            return self._cache.fetch(
+                bucket, filter, start, stop, query, time_column, sort_by
+            )
+        return query(start, stop)
+
+    def _query_spike_event(
         self, start: datetime, stop: datetime, fsname: str
     ) -> pd.DataFrame:
         query_api = self._connect_to_db()
@@ -45,9 +109,30 @@ class DatabaseController:
             df = df.drop(columns=["result", "table"]).astype({"channel": int})
         return df
 
+    async def _get_spike_event(
+        self, start: datetime, stop: datetime, fsname: str
+    ) -> pd.DataFrame:
+        if self._archive is not None and is_immutable(stop):
+            return self._archive.fetch(
+                "spikeevent",
+                fsname,
+                start,
+                stop,
+                lambda a, b: self._query_spike_event(a, b, fsname),
+            )
+        return self._cached(
+            "spikeevent",
+            f'_measurement == "{fsname}"',
+            start,
+            stop,
+            lambda a, b: self._query_spike_event(a, b, fsname),
+        )
+
     @classmethod
-    async def get_spike_event(cls, query: SpikeEventQuery) -> Optional[pd.DataFrame]:
-        controller = cls()
+    async def get_spike_event(
+        cls, query: SpikeEventQuery, controller: Optional["DatabaseController"] = None
+    ) -> Optional[pd.DataFrame]:
+        controller = controller or cls()
         try:
             return await controller._get_spike_event(
                 query.start, query.stop, query.fsname
@@ -55,7 +140,7 @@ class DatabaseController:
         except DatabaseQueryError as e:
             raise DatabaseQueryError(f"Failed to get spike event from db: {str(e)}")
 
-    async def _get_raw_spike(
+    def _query_raw_spike(
         self, start: datetime, stop: datetime, index: int
     ) -> pd.DataFrame:
         query_api = self._connect_to_db()
@@ -70,15 +155,30 @@ class DatabaseController:
             df = df.drop(columns=["result", "table"]).astype({"channel": int})
         return df
 
+    async def _get_raw_spike(
+        self, start: datetime, stop: datetime, index: int
+    ) -> pd.DataFrame:
+        if self._archive is not None and is_immutable(stop):
+            return self._archive.fetch(
+                "rawspike",
+                index,
+                start,
+                stop,
+                lambda a, b: self._query_raw_spike(a, b, index),
+            )
+        return self._query_raw_spike(start, stop, index)
+
     @classmethod
-    async def get_raw_spike(cls, query: RawSpikeQuery) -> pd.DataFrame:
-        controller = cls()
+    async def get_raw_spike(
+        cls, query: RawSpikeQuery, controller: Optional["DatabaseController"] = None
+    ) -> pd.DataFrame:
+        controller = controller or cls()
         try:
             return await controller._get_raw_spike(query.start, query.stop, query.index)
         except DatabaseQueryError as e:
             raise DatabaseQueryError(f"Failed to get raw spike from db: {str(e)}")
 
-    async def _get_spike_count(
+    def _query_spike_count(
         self, start: datetime, stop: datetime, fsname: str
     ) -> pd.DataFrame:
         query_api = self._connect_to_db()
@@ -93,9 +193,22 @@ class DatabaseController:
             df = df.drop(columns=["result", "table"]).astype({"channel": int})
         return df
 
+    async def _get_spike_count(
+        self, start: datetime, stop: datetime, fsname: str
+    ) -> pd.DataFrame:
+        return self._cached(
+            "spikecount",
+            f'_measurement == "{fsname}"',
+            start,
+            stop,
+            lambda a, b: self._query_spike_count(a, b, fsname),
+        )
+
     @classmethod
-    async def get_spike_count(cls, query: SpikeCountQuery) -> pd.DataFrame:
-        controller = cls()
+    async def get_spike_count(
+        cls, query: SpikeCountQuery, controller: Optional["DatabaseController"] = None
+    ) -> pd.DataFrame:
+        controller = controller or cls()
         try:
             return await controller._get_spike_count(
                 query.start, query.stop, query.fsname
@@ -103,7 +216,7 @@ class DatabaseController:
         except DatabaseQueryError as e:
             raise DatabaseQueryError(f"Failed to get spike count from db: {str(e)}")
 
-    async def _get_all_triggers(self, start: datetime, stop: datetime) -> pd.DataFrame:
+    def _query_all_triggers(self, start: datetime, stop: datetime) -> pd.DataFrame:
         query_api = self._connect_to_db()
         query = f'from(bucket:"stimevent")\
             |> range(start: {start.strftime("%Y-%m-%dT%H:%M:%S.%fZ")}, stop: {stop.strftime("%Y-%m-%dT%H:%M:%S.%fZ")})\
@@ -121,14 +234,339 @@ class DatabaseController:
             )
         return df
 
+    async def _get_all_triggers(self, start: datetime, stop: datetime) -> pd.DataFrame:
+        return self._cached(
+            "stimevent",
+            '_measurement == "trigger"',
+            start,
+            stop,
+            self._query_all_triggers,
+            time_column="_time",
+            sort_by=["_time", "trigger"],
+        )
+
     @classmethod
-    async def get_all_triggers(cls, query: TriggersQuery) -> pd.DataFrame:
-        controller = cls()
+    async def get_all_triggers(
+        cls, query: TriggersQuery, controller: Optional["DatabaseController"] = None
+    ) -> pd.DataFrame:
+        controller = controller or cls()
         try:
             return await controller._get_all_triggers(query.start, query.stop)
         except DatabaseQueryError as e:
             raise DatabaseQueryError(f"Failed to get all triggers from db: {str(e)}")
 
+    def _query_tagged_triggers(
+        self, start: datetime, stop: datetime, tag: int
+    ) -> pd.DataFrame:
+        query_api = self._connect_to_db()
+        query = f'from(bucket:"stimevent")\
+            |> range(start: {start.strftime("%Y-%m-%dT%H:%M:%S.%fZ")}, stop: {stop.strftime("%Y-%m-%dT%H:%M:%S.%fZ")})\
+            |> filter(fn:(r) => r["_measurement"] == "trigger" and r["tag"] == "{tag}")\
+            |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")\
+            |> drop(columns: ["_start", "_stop", "_field", "_measurement"])\
+            |> rename(columns: {{index: "trigger"}})'
+        df = query_api.query_data_frame(query=query, org="FinalSpark")
+        if len(df.index) > 0:
+            df = (
+                df.drop(columns=["result", "table"])
+                .sort_values(by=["_time", "trigger"], ignore_index=True)
+                .astype({"trigger": int})
+                .astype({"up": int})
+            )
+        return df
+
+    async def _get_tagged_triggers(
+        self, start: datetime, stop: datetime, tag: int
+    ) -> pd.DataFrame:
+        return self._cached(
+            "stimevent",
+            f'_measurement == "trigger" and tag == "{tag}"',
+            start,
+            stop,
+            lambda a, b: self._query_tagged_triggers(a, b, tag),
+            time_column="_time",
+            sort_by=["_time", "trigger"],
+        )
+
+    @classmethod
+    async def get_tagged_triggers(
+        cls,
+        query: TaggedTriggersQuery,
+        controller: Optional["DatabaseController"] = None,
+    ) -> pd.DataFrame:
+        """Triggers sent with a tag, filtered on the indexed tag instead of scanning
+        all the triggers of the range. See IntanController.set_trigger_tags.
+        """
+        controller = controller or cls()
+        try:
+            return await controller._get_tagged_triggers(
+                query.start, query.stop, query.tag
+            )
+        except DatabaseQueryError as e:
+            raise DatabaseQueryError(
+                f"Failed to get tagged triggers from db: {str(e)}"
+            )
+
+    # MARK: Aggregation in the database
+
+    def _query_aggregate(
+        self,
+        bucket: str,
+        start: datetime,
+        stop: datetime,
+        fsname: str,
+        every: str,
+        fn: AggregateFn,
+        quantile: float,
+        field: str = "voltage",
+        predicate: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """Aggregate a field per channel and time window in Flux.
+        :type predicate: str, optional
+            Flux filter of the rows instead of the measurement fsname
+        :return pd.DataFrame
+            Dense matrix indexed by window time, with one column per channel
+        """
+        query_api = self._connect_to_db()
+        predicate = predicate or f'r["_measurement"] == "{fsname}"'
+        if fn == AggregateFn.Quantile:
+            reducer = f"(column, tables=<-) => tables |> quantile(q: {quantile}, column: column)"
+        else:
+            reducer = fn.value
+        query = f'from(bucket:"{bucket}")\
+            |> range(start: {start.strftime("%Y-%m-%dT%H:%M:%S.%fZ")}, stop: {stop.strftime("%Y-%m-%dT%H:%M:%S.%fZ")})\
+            |> filter(fn:(r) => {predicate} and r["_field"] == "{field}")\
+            |> group(columns: ["index"])\
+            |> aggregateWindow(every: {every}, fn: {reducer}, createEmpty: true)\
+            |> keep(columns: ["_time", "index", "_value"])\
+            |> group()\
+            |> pivot(rowKey:["_time"], columnKey: ["index"], valueColumn: "_value")'
+        df = query_api.query_data_frame(query=query, org="FinalSpark")
+        if len(df.index) > 0:
+            df = (
+                df.drop(columns=["result", "table"])
+                .rename(columns={"_time": "Time"})
+                .set_index("Time")
+                .sort_index()
+            )
+            df.columns = df.columns.astype(int)
+            df = df[sorted(df.columns)]
+        return df
+
+    @classmethod
+    async def get_spike_event_matrix(
+        cls,
+        query: SpikeAggregateQuery,
+        controller: Optional["DatabaseController"] = None,
+    ) -> pd.DataFrame:
+        """Spike events aggregated per time window and channel.
+        Count gives the number of spikes, other reducers apply to the max amplitude.
+        """
+        controller = controller or cls()
+        try:
+            return controller._query_aggregate(
+                "spikeevent",
+                query.start,
+                query.stop,
+                query.fsname,
+                query.every,
+                query.fn,
+                query.quantile,
+            )
+        except DatabaseQueryError as e:
+            raise DatabaseQueryError(
+                f"Failed to aggregate spike event from db: {str(e)}"
+            )
+
+    @classmethod
+    async def get_spike_count_matrix(
+        cls,
+        query: SpikeAggregateQuery,
+        controller: Optional["DatabaseController"] = None,
+    ) -> pd.DataFrame:
+        """Spike per minutes aggregated per time window and channel"""
+        controller = controller or cls()
+        try:
+            return controller._query_aggregate(
+                "spikecount",
+                query.start,
+                query.stop,
+                query.fsname,
+                query.every,
+                query.fn,
+                query.quantile,
+            )
+        except DatabaseQueryError as e:
+            raise DatabaseQueryError(
+                f"Failed to aggregate spike count from db: {str(e)}"
+            )
+
+    # MARK: Streaming of long time ranges
+
+    @classmethod
+    async def stream_spike_event(
+        cls,
+        query: SpikeEventQuery,
+        chunk: Optional[timedelta] = None,
+        controller: Optional["DatabaseController"] = None,
+    ) -> AsyncIterator[pd.DataFrame]:
+        """Stream spike events by adaptive time chunks of bounded size"""
+        controller = controller or cls()
+        try:
+            async for df in stream_query(
+                query.start,
+                query.stop,
+                lambda a, b: controller._query_spike_event(a, b, query.fsname),
+                chunk,
+            ):
+                yield df
+        except DatabaseQueryError as e:
+            raise DatabaseQueryError(f"Failed to stream spike event from db: {str(e)}")
+
+    @classmethod
+    async def stream_raw_spike(
+        cls,
+        query: RawSpikeQuery,
+        chunk: Optional[timedelta] = None,
+        controller: Optional["DatabaseController"] = None,
+    ) -> AsyncIterator[pd.DataFrame]:
+        """Stream raw spikes by adaptive time chunks of bounded size"""
+        controller = controller or cls()
+        try:
+            async for df in stream_query(
+                query.start,
+                query.stop,
+                lambda a, b: controller._query_raw_spike(a, b, query.index),
+                chunk,
+            ):
+                yield df
+        except DatabaseQueryError as e:
+            raise DatabaseQueryError(f"Failed to stream raw spike from db: {str(e)}")
+
+    @classmethod
+    async def stream_spike_count(
+        cls,
+        query: SpikeCountQuery,
+        chunk: Optional[timedelta] = None,
+        controller: Optional["DatabaseController"] = None,
+    ) -> AsyncIterator[pd.DataFrame]:
+        """Stream spike counts by adaptive time chunks of bounded size"""
+        controller = controller or cls()
+        try:
+            async for df in stream_query(
+                query.start,
+                query.stop,
+                lambda a, b: controller._query_spike_count(a, b, query.fsname),
+                chunk,
+            ):
+                yield df
+        except DatabaseQueryError as e:
+            raise DatabaseQueryError(f"Failed to stream spike count from db: {str(e)}")
+
+    # MARK: Bounded summaries for the tools
+
+    def _aggregator(
+        self, bucket: str, predicate: str, field: str = "voltage"
+    ) -> Aggregator:
+        """aggregate(start, stop, every, fn) of a field for summarize"""
+        return lambda start, stop, every, fn: self._query_aggregate(
+            bucket, start, stop, "", every, fn, 0.5, field, predicate
+        )
+
+    @classmethod
+    async def summarize_spike_event(
+        cls,
+        query: SpikeEventSummaryQuery,
+        controller: Optional["DatabaseController"] = None,
+    ) -> DataPage:
+        """Spike events as a page of rows or a per channel summary"""
+        controller = controller or cls()
+        try:
+            return await summarize(
+                lambda a, b: controller._query_spike_event(a, b, query.fsname),
+                query.start,
+                query.stop,
+                query,
+                "Max Amplitude",
+                aggregate=controller._aggregator(
+                    "spikeevent", f'r["_measurement"] == "{query.fsname}"'
+                ),
+            )
+        except DatabaseQueryError as e:
+            raise DatabaseQueryError(
+                f"Failed to summarize spike event from db: {str(e)}"
+            )
+
+    @classmethod
+    async def summarize_raw_spike(
+        cls,
+        query: RawSpikeSummaryQuery,
+        controller: Optional["DatabaseController"] = None,
+    ) -> DataPage:
+        """Raw spikes as a page of rows or a per channel summary"""
+        controller = controller or cls()
+        try:
+            return await summarize(
+                lambda a, b: controller._query_raw_spike(a, b, query.index),
+                query.start,
+                query.stop,
+                query,
+                "Amplitude",
+                aggregate=controller._aggregator(
+                    "rawspike", f'r["index"] == "{query.index}"'
+                ),
+            )
+        except DatabaseQueryError as e:
+            raise DatabaseQueryError(f"Failed to summarize raw spike from db: {str(e)}")
+
+    @classmethod
+    async def summarize_spike_count(
+        cls,
+        query: SpikeCountSummaryQuery,
+        controller: Optional["DatabaseController"] = None,
+    ) -> DataPage:
+        """Spike counts as a page of rows or a per channel summary"""
+        controller = controller or cls()
+        try:
+            return await summarize(
+                lambda a, b: controller._query_spike_count(a, b, query.fsname),
+                query.start,
+                query.stop,
+                query,
+                "Spike per minutes",
+                aggregate=controller._aggregator(
+                    "spikecount", f'r["_measurement"] == "{query.fsname}"'
+                ),
+            )
+        except DatabaseQueryError as e:
+            raise DatabaseQueryError(
+                f"Failed to summarize spike count from db: {str(e)}"
+            )
+
+    @classmethod
+    async def summarize_all_triggers(
+        cls,
+        query: TriggersSummaryQuery,
+        controller: Optional["DatabaseController"] = None,
+    ) -> DataPage:
+        """Triggers as a page of rows or a per trigger summary"""
+        controller = controller or cls()
+        try:
+            return await summarize(
+                controller._query_all_triggers,
+                query.start,
+                query.stop,
+                query,
+                "up",
+                time_column="_time",
+                key_column="trigger",
+                aggregate=controller._aggregator(
+                    "stimevent", 'r["_measurement"] == "trigger"', "up"
+                ),
+            )
+        except DatabaseQueryError as e:
+            raise DatabaseQueryError(f"Failed to summarize triggers from db: {str(e)}")
+
 
 async def get_spike_event(query: SpikeEventQuery) -> Optional[pd.DataFrame]:
     validator = SpikeEventQuery(start=query.start, stop=query.stop, fsname=query.fsname)
@@ -148,3 +586,14 @@ async def get_spike_count(cls, query: SpikeCountQuery) -> pd.DataFrame:
 async def get_all_triggers(query: TriggersQuery) -> pd.DataFrame:
     validator = TriggersQuery(start=query.start, stop=query.stop)
     return await DatabaseController.get_all_triggers(validator)
+
+
+async def stream_raw_spike(query: RawSpikeQuery) -> AsyncIterator[pd.DataFrame]:
+    validator = RawSpikeQuery(start=query.start, stop=query.stop, index=query.index)
+    async for df in DatabaseController.stream_raw_spike(validator):
+        yield df
+
+
+async def get_tagged_triggers(query: TaggedTriggersQuery) -> pd.DataFrame:
+    validator = TaggedTriggersQuery(start=query.start, stop=query.stop, tag=query.tag)
+    return await DatabaseController.get_tagged_triggers(validator)
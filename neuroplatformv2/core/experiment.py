@@ -1,9 +1,20 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
 from bson.objectid import ObjectId
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
 
 from ..utils.constants import (
+    EXPERIMENT_LEASE,
+    MONGO_DB_CACHE_TTL,
     MONGO_DB_IP,
     MONGO_DB_PASSWORD,
+    MONGO_DB_POOL_SIZE,
     MONGO_DB_PORT,
     MONGO_DB_USER,
 )
@@ -18,9 +29,66 @@ from ..utils.exceptions import (
 from ..utils.schemas import (
     ExperimentRequest,
     ExperimentStimParamRequest,
+    ExperimentStimParamsRequest,
     StimParam,
+    StimParamBank,
 )
 
+# Status document of the intan software in the 'intan' collection
+INTAN_STATUS_ID = ObjectId("651c6fa7f916078db0ebcecd")
+
+
+class TTLCache:
+    """Small cache of documents, each entry expires after ttl seconds"""
+
+    def __init__(self, ttl: float):
+        self._ttl = ttl
+        self._entries: Dict[Any, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, loader: Callable[[], Any]) -> Any:
+        """Cached value of key, loaded with loader() if missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+        value = loader()
+        with self._lock:
+            self._entries[key] = (now + self._ttl, value)
+        return value
+
+    def invalidate(self, key: Any):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+
+# Best stim parameter documents by electrode index, with their "updated" time.
+# StimParams are built from them on every call: to_grpc() consumes the changes.
+_best_params: Dict[int, dict] = {}
+
+# Experiment documents by token and intan status document
+_experiments = TTLCache(MONGO_DB_CACHE_TTL)
+_intan_status = TTLCache(MONGO_DB_CACHE_TTL)
+
+# Lease renewal tasks of the experiments started by this process, by token
+_leases: Dict[str, asyncio.Task] = {}
+
+
+def get_database() -> Database:
+    """Database of the process-wide MongoClient. The client pools its connections."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MongoClient(
+                f"mongodb://{MONGO_DB_USER}:{MONGO_DB_PASSWORD}@{MONGO_DB_IP}:{MONGO_DB_PORT}/",
+                maxPoolSize=MONGO_DB_POOL_SIZE,
+            )
+    return _client["neuroplatform"]
+
 
 class ExperimentController:
     """
@@ -46,10 +114,7 @@ class ExperimentController:
         """
         # Connect to MongoDB
         try:
-            self._client = MongoClient(
-                f"mongodb://{MONGO_DB_USER}:{MONGO_DB_PASSWORD}@{MONGO_DB_IP}:{MONGO_DB_PORT}/"
-            )
-            self._db = self._client["neuroplatform"]
+            self._db = get_database()
         except ExperimentControllerDBConnectionError:
             raise ExperimentControllerDBConnectionError(
                 "Experiment controller failed connecting to the mongodb"
@@ -58,7 +123,9 @@ class ExperimentController:
         try:
             # Fetch the experiment document with the given token from the 'experiments' collection
             self._collection = self._db["experiments"]
-            self.experiment = self._collection.find_one({"token": token})
+            self.experiment = _experiments.get(
+                token, lambda: self._collection.find_one({"token": token})
+            )
             self.token = token
         except ExperimentControllerDBQueryError:
             raise ExperimentControllerDBQueryError(
@@ -79,87 +146,163 @@ class ExperimentController:
         self.electrodes = self.experiment["electrodes"]
         self.exp_name = self.experiment["exp_name"]
 
+    def _intan_status(self) -> dict:
+        """Status document of the intan software, cached for MONGO_DB_CACHE_TTL seconds"""
+        return _intan_status.get(
+            INTAN_STATUS_ID,
+            lambda: self._db["intan"].find_one({"_id": INTAN_STATUS_ID}),
+        )
+
     async def _start(self):
         """
         Start the experiment.
+        The intan status document is checked and locked in one atomic update. The lock
+        is a lease of EXPERIMENT_LEASE seconds, renewed in the background by start()
+        until stop(); an expired lease can be taken over.
 
         Returns:
             bool: True if the experiment was started successfully, False otherwise.
         """
-        # Connect to the 'intan' collection
-        intan_collection = self._db["intan"]
-
-        # Fetch the current status of the document
-        current_status = intan_collection.find_one(
-            {"_id": ObjectId("651c6fa7f916078db0ebcecd")}
+        # Check if can_run is still True (document cached for MONGO_DB_CACHE_TTL seconds)
+        refreshed_experiment = _experiments.get(
+            self.token, lambda: self._collection.find_one({"token": self.token})
         )
-
-        # Check if exp_running is True
-        if current_status.get("exp_running", False):
-            print("Experiment is already running!")
+        if not refreshed_experiment.get("can_run", False):
+            print("Error: Experiment cannot be run.")
             return False
 
-        # Check if maintenance is True
+        # Set 'exp_running' to True if not running (or lease expired) and not in maintenance
+        now = datetime.now(timezone.utc)
+        status = self._db["intan"].find_one_and_update(
+            {
+                "_id": INTAN_STATUS_ID,
+                "maintenance": {"$ne": True},
+                "$or": [
+                    {"exp_running": {"$ne": True}},
+                    {"lease_expires": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "exp_running": True,
+                    "token": self.token,
+                    "lease_expires": now + timedelta(seconds=EXPERIMENT_LEASE),
+                }
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+        _intan_status.invalidate(INTAN_STATUS_ID)
+        if status is not None:
+            return True
+
+        # Find out why the experiment could not start
+        current_status = self._intan_status()
         if current_status.get("maintenance", False):
             print("System is currently under maintenance!")
-            return False
+        else:
+            print("Experiment is already running!")
+        return False
 
-        # Re-fetch the experiment document to check if can_run is still True
-        refreshed_experiment = self._collection.find_one({"token": self.token})
-        if not refreshed_experiment.get("can_run", False):
-            print("Error: Experiment cannot be run.")
+    @classmethod
+    async def start(cls, req: ExperimentRequest) -> bool:
+        try:
+            controller = cls(req.token)
+            started = await controller._start()
+        except ExperimentStartError:
             return False
+        if started:
+            lease = _leases.pop(req.token, None)
+            if lease is not None:
+                lease.cancel()
+            _leases[req.token] = controller.keep_alive()
+        return started
+
+    async def _heartbeat(self) -> bool:
+        """
+        Renew the lease of the running experiment.
 
-        # Update the document in the 'intan' collection to set 'exp_running' to True
-        intan_collection.update_one(
-            {"_id": ObjectId("651c6fa7f916078db0ebcecd")},
-            {"$set": {"exp_running": True, "token": self.token}},
+        Returns:
+            bool: True if the lease was renewed, False if the experiment does not hold it.
+        """
+        now = datetime.now(timezone.utc)
+        status = self._db["intan"].find_one_and_update(
+            {"_id": INTAN_STATUS_ID, "token": self.token, "exp_running": True},
+            {"$set": {"lease_expires": now + timedelta(seconds=EXPERIMENT_LEASE)}},
         )
-        return True
+        return status is not None
 
     @classmethod
-    async def start(cls, req: ExperimentRequest) -> bool:
+    async def heartbeat(cls, req: ExperimentRequest) -> bool:
         try:
             controller = cls(req.token)
-            return await controller._start()
-        except ExperimentStartError:
+            return await controller._heartbeat()
+        except (PyMongoError, ExperimentControllerDataError):
             return False
 
+    async def _keep_alive(self, interval: float):
+        """Renew the lease every interval seconds until cancelled or lost"""
+        while True:
+            try:
+                if not await self._heartbeat():
+                    break
+            except PyMongoError as e:
+                # The lease is still valid for a while, retry at the next interval
+                print(f"Error: Experiment lease renewal failed: {str(e)}")
+            await asyncio.sleep(interval)
+        print("Error: Experiment lease lost!")
+
+    def keep_alive(self, interval: Optional[float] = None) -> asyncio.Task:
+        """
+        Renew the lease in the background, every third of the lease by default.
+        start() runs it and stop() cancels it.
+        """
+        return asyncio.ensure_future(
+            self._keep_alive(interval or EXPERIMENT_LEASE / 3)
+        )
+
     async def _stop(self):
         """
-        Stop the experiment.
+        Stop the experiment, in one atomic update if the token holds the lock.
 
         Returns:
             bool: True if the experiment was stopped successfully, False otherwise.
         """
-        # Connect to the 'intan' collection
-        intan_collection = self._db["intan"]
-
-        # Fetch the current status of the document
-        current_status = intan_collection.find_one(
-            {"_id": ObjectId("651c6fa7f916078db0ebcecd")}
+        # Set 'exp_running' to False if the tokens match
+        status = self._db["intan"].find_one_and_update(
+            {"_id": INTAN_STATUS_ID, "token": self.token},
+            {"$set": {"exp_running": False}, "$unset": {"lease_expires": ""}},
         )
-
-        # Check if the tokens match
-        if current_status.get("token") != self.token:
+        _intan_status.invalidate(INTAN_STATUS_ID)
+        if status is None:
             print("Error: Token mismatch!")
             return False
-
-        # Update the document in the 'intan' collection to set 'exp_running' to False
-        intan_collection.update_one(
-            {"_id": ObjectId("651c6fa7f916078db0ebcecd")},
-            {"$set": {"exp_running": False}},
-        )
         return True
 
     @classmethod
     async def stop(cls, req: ExperimentRequest) -> bool:
+        lease = _leases.pop(req.token, None)
+        if lease is not None:
+            lease.cancel()
         try:
             controller = cls(req.token)
             return await controller._stop()
         except ExperimentStopError:
             return False
 
+    @staticmethod
+    def _stim_param_from_doc(best_param: dict) -> StimParam:
+        """Build the StimParam of a best_stim_param document"""
+        sp = StimParam()
+        sp.index = best_param["index"]
+        sp.polarity = StimPolarity(best_param["polarity"])
+        sp.phase_duration1 = best_param["phase_duration1"]
+        sp.phase_amplitude1 = best_param["amplitude1"]
+        sp.phase_duration2 = best_param["phase_duration2"]
+        sp.phase_amplitude2 = best_param["amplitude2"]
+        sp.stim_shape = StimShape(best_param["shape"])
+        sp.interphase_delay = best_param["interphase_delay"]
+        return sp
+
     async def _best_stim_param(self, index_electrode: int):
         """
         Get the best stimparam for an electrode
@@ -178,16 +321,7 @@ class ExperimentController:
         except ExperimentControllerDBQueryError:
             return None
 
-        sp = StimParam()
-        sp.index = best_param["index"]
-        sp.polarity = StimPolarity(best_param["polarity"])
-        sp.phase_duration1 = best_param["phase_duration1"]
-        sp.phase_amplitude1 = best_param["amplitude1"]
-        sp.phase_duration2 = best_param["phase_duration2"]
-        sp.phase_amplitude2 = best_param["amplitude2"]
-        sp.stim_shape = StimShape(best_param["shape"])
-        sp.interphase_delay = best_param["interphase_delay"]
-        return sp, best_param["updated"]
+        return self._stim_param_from_doc(best_param), best_param["updated"]
 
     @classmethod
     async def best_stim_param(cls, req: ExperimentStimParamRequest) -> StimParam | None:
@@ -197,6 +331,56 @@ class ExperimentController:
         except ExperimentControllerDBQueryError:
             return None
 
+    async def _best_stim_params(self, electrodes: List[int]) -> StimParamBank:
+        """
+        Get the best stimparams of several electrodes in one query.
+        Parameters are cached with their update time, and only the electrodes
+        not cached or updated since are returned by the database.
+
+        Args:
+            electrodes (List[int]): Index electrodes.
+        Returns:
+            StimParamBank: Best stimulation parameters, electrodes without one are skipped
+        """
+        if not electrodes:
+            return StimParamBank.from_stim_params([], [])
+
+        cached = {
+            i: _best_params[i]["updated"] for i in electrodes if i in _best_params
+        }
+        conditions = [{"index": i, "updated": {"$gt": cached[i]}} for i in cached]
+        missing = [i for i in electrodes if i not in cached]
+        if missing:
+            conditions.append({"index": {"$in": missing}})
+
+        try:
+            col = self._db["best_stim_param"]
+            for best_param in col.find({"$or": conditions}, {"_id": 0}):
+                _best_params[best_param["index"]] = best_param
+        except ExperimentControllerDBQueryError:
+            raise ExperimentControllerDBQueryError(
+                "Experiment controller failed querying best stim params"
+            )
+
+        docs = [_best_params[i] for i in electrodes if i in _best_params]
+        return StimParamBank.from_stim_params(
+            [self._stim_param_from_doc(doc) for doc in docs],
+            [doc["updated"] for doc in docs],
+        )
+
+    @classmethod
+    async def best_stim_params(
+        cls, req: ExperimentStimParamsRequest
+    ) -> StimParamBank | None:
+        try:
+            controller = cls(req.token)
+            electrodes = req.electrodes
+            if electrodes is None:
+                electrodes = controller.electrodes
+            return await controller._best_stim_params(electrodes)
+        except ExperimentControllerDBQueryError:
+            return None
+
 
 async def start_experiment(req: ExperimentRequest) -> bool:
     validator = ExperimentRequest(token=req.token)
@@ -208,8 +392,18 @@ async def stop_experiment(req: ExperimentRequest) -> bool:
     return await ExperimentController.stop(validator)
 
 
+async def heartbeat_experiment(req: ExperimentRequest) -> bool:
+    validator = ExperimentRequest(token=req.token)
+    return await ExperimentController.heartbeat(validator)
+
+
 async def best_stim_param(req: ExperimentStimParamRequest) -> StimParam | None:
     validator = ExperimentStimParamRequest(
         token=req.token, index_electrode=req.index_electrode
     )
     return await ExperimentController.best_stim_param(validator)
+
+
+async def best_stim_params(req: ExperimentStimParamsRequest) -> StimParamBank | None:
+    validator = ExperimentStimParamsRequest(token=req.token, electrodes=req.electrodes)
+    return await ExperimentController.best_stim_params(validator)
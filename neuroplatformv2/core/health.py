@@ -0,0 +1,135 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from ..utils.constants import (
+    INTAN_HEALTH_INTERVAL,
+    INTAN_HEALTH_MAX_LOOP_MS,
+    INTAN_HEALTH_MAX_RAW_QUEUE,
+)
+from ..utils.schemas import IntanHealthState
+from .intan import IntanController
+
+
+class IntanHealthMonitor:
+    """Poll the debuginfo of the Intan software in the background.
+
+    The last state is cached, so is_ready() answers without any RPC and the caller
+    can skip or delay a stimulation instead of waiting for a call to time out. The
+    board is ready if the last poll succeeded less than 3 intervals ago, and the
+    raw queue and the loop duration are under their limits.
+    """
+
+    def __init__(
+        self,
+        interval: float = INTAN_HEALTH_INTERVAL,
+        max_raw_queue: float = INTAN_HEALTH_MAX_RAW_QUEUE,
+        max_loop_ms: int = INTAN_HEALTH_MAX_LOOP_MS,
+        controller: Optional[IntanController] = None,
+    ):
+        self._interval = interval
+        self._max_raw_queue = max_raw_queue
+        self._max_loop_ms = max_loop_ms
+        self._controller = controller
+        self._state: Optional[IntanHealthState] = None
+        self._polls = 0
+        self._failures = 0
+        self._consecutive_failures = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def poll(self) -> IntanHealthState:
+        """Sample the state once"""
+        if self._controller is None:
+            self._controller = IntanController()
+        start = time.monotonic()
+        try:
+            info = await self._controller._debug_info(timeout=self._interval)
+        except Exception as e:
+            self._failures += 1
+            self._consecutive_failures += 1
+            state = IntanHealthState(ready=False, updated=start, error=str(e))
+        else:
+            self._consecutive_failures = 0
+            state = IntanHealthState(
+                ready=info.raw_queue <= self._max_raw_queue
+                and info.loop_ms <= self._max_loop_ms,
+                raw_queue=info.raw_queue,
+                loop_ms=info.loop_ms,
+                latency=time.monotonic() - start,
+                updated=start,
+            )
+        self._polls += 1
+        self._state = state
+        return state
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await self.poll()
+            await asyncio.sleep(max(self._interval - (time.monotonic() - started), 0))
+
+    def start(self):
+        """Start polling in the running loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._controller is not None:
+            await self._controller._close()
+            self._controller = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def state(self) -> Optional[IntanHealthState]:
+        """Last sampled state, None before the first poll"""
+        return self._state
+
+    def is_ready(self) -> bool:
+        """True if the last state is ready and recent"""
+        state = self._state
+        return (
+            state is not None
+            and state.ready
+            and time.monotonic() - state.updated < 3 * self._interval
+        )
+
+    def metrics(self) -> Dict[str, Any]:
+        state = self._state
+        return {
+            "ready": self.is_ready(),
+            "polls": self._polls,
+            "failures": self._failures,
+            "consecutive_failures": self._consecutive_failures,
+            "raw_queue": state.raw_queue if state else None,
+            "loop_ms": state.loop_ms if state else None,
+            "latency": state.latency if state else None,
+            "age": time.monotonic() - state.updated if state else None,
+            "error": state.error if state else None,
+        }
+
+    async def wait_ready(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for the board to be ready"""
+        deadline = time.monotonic() + timeout
+        while not self.is_ready():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(min(self._interval, deadline - time.monotonic()))
+        return True
+
+
+_monitor = IntanHealthMonitor()
+
+
+def get_intan_health() -> IntanHealthMonitor:
+    """Health monitor shared by the process, started with start()"""
+    return _monitor
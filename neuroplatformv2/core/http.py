@@ -0,0 +1,105 @@
+import asyncio
+import json
+from typing import Any, Optional
+
+import aiohttp
+
+from ..utils.constants import (
+    HTTP_LIMIT_PER_HOST,
+    HTTP_RETRIES,
+    HTTP_RETRY_DELAY,
+    HTTP_TIMEOUT,
+)
+from ..utils.exceptions import HTTPRequestError
+
+
+class HTTPResponse:
+    """Response of the HTTPClient. The body is read before the connection is released."""
+
+    def __init__(self, url: str, status_code: int, content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPRequestError(f"Status code: {self.status_code} for {self.url}")
+
+
+class HTTPClient:
+    """Async HTTP client shared by the controllers of the HTTP devices.
+    One keep-alive session, with a connection limit per host, timeouts and retries.
+    """
+
+    def __init__(
+        self,
+        limit_per_host: int = HTTP_LIMIT_PER_HOST,
+        timeout: float = HTTP_TIMEOUT,
+        retries: int = HTTP_RETRIES,
+    ):
+        self._limit_per_host = limit_per_host
+        self._timeout = timeout
+        self._retries = retries
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Session of the running loop, created on first use. The session of a
+        previous loop is closed before it is replaced."""
+        loop = asyncio.get_running_loop()
+        if self._session is not None and self._loop is not loop:
+            await self.close()
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self._limit_per_host),
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+            )
+            self._loop = loop
+        return self._session
+
+    async def request(
+        self, method: str, url: str, json: Optional[Any] = None
+    ) -> HTTPResponse:
+        """Send the request. Connection errors, timeouts and 5xx are retried for GET
+        only, a POST may have reached the device and is not sent twice.
+        :type method: str
+        :type url: str
+        :type json: Any, optional
+            JSON body
+        """
+        session = await self._get_session()
+        retries = self._retries if method == "GET" else 0
+        for attempt in range(retries + 1):
+            last = attempt == retries
+            try:
+                async with session.request(method, url, json=json) as r:
+                    content = await r.read()
+                if r.status < 500 or last:
+                    return HTTPResponse(url, r.status, content)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if last:
+                    raise HTTPRequestError(f"Request to {url} failed: {str(e)}")
+            await asyncio.sleep(HTTP_RETRY_DELAY * 2**attempt)
+
+    async def get(self, url: str) -> HTTPResponse:
+        return await self.request("GET", url)
+
+    async def post(self, url: str, json: Optional[Any] = None) -> HTTPResponse:
+        return await self.request("POST", url, json=json)
+
+    async def close(self):
+        """Close the session"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+_client = HTTPClient()
+
+
+def get_http_client() -> HTTPClient:
+    """HTTP client shared by the process"""
+    return _client
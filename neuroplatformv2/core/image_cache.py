@@ -0,0 +1,149 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+from ..utils.constants import (
+    CAMERA_CACHE_DIR,
+    CAMERA_CACHE_MEMORY,
+    CAMERA_CACHE_SIZE,
+)
+
+
+class ImageCache:
+    """Local cache of camera images. An image never changes once captured, so the
+    cache is keyed by image id and never invalidated.
+
+    The JPEG bytes and the decoded RGB frames (.npy) are kept on disk, bounded by
+    `max_bytes` with least recently used eviction. Decoded frames are served
+    memory-mapped (read-only) and the most recent ones are kept in an in-memory
+    LRU bounded by `memory_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, memory_bytes: int):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._memory_bytes = memory_bytes
+        self._frames: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._frames_bytes = 0
+        self._lock = threading.Lock()
+        self._disk_bytes = self._disk_usage()
+
+    def _path(self, kind: str, img_id: str, ext: str) -> str:
+        return os.path.join(self._directory, kind, img_id[:2], f"{img_id}.{ext}")
+
+    def _disk_usage(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self._directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+        return total
+
+    def _write(self, path: str, write):
+        """Write atomically with write(file) and evict the oldest files if needed"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+        with self._lock:
+            self._disk_bytes += os.path.getsize(path)
+            if self._disk_bytes > self._max_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        """Remove the least recently used files down to 90% of the size limit.
+        Temporary files of writes in progress are left alone, and files removed
+        concurrently are skipped."""
+        files = []
+        for root, _, names in os.walk(self._directory):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        self._disk_bytes = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self._disk_bytes <= 0.9 * self._max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._disk_bytes -= size
+
+    def _read(self, path: str) -> Optional[str]:
+        """Path of a cached file, marked as recently used"""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get_jpeg(self, kind: str, img_id: str) -> Optional[bytes]:
+        """JPEG bytes of an image or thumbnail, None if not cached"""
+        path = self._read(self._path(kind, img_id, "jpg"))
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def put_jpeg(self, kind: str, img_id: str, content: bytes):
+        self._write(self._path(kind, img_id, "jpg"), lambda f: f.write(content))
+
+    def _keep_frame(self, key: Tuple[str, str], img: np.ndarray):
+        with self._lock:
+            if key in self._frames or img.nbytes > self._memory_bytes:
+                return
+            self._frames[key] = img
+            self._frames_bytes += img.nbytes
+            while self._frames_bytes > self._memory_bytes:
+                _, old = self._frames.popitem(last=False)
+                self._frames_bytes -= old.nbytes
+
+    def get_frame(self, kind: str, img_id: str) -> Optional[np.ndarray]:
+        """Decoded RGB frame (read-only memory map), None if not cached"""
+        key = (kind, img_id)
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return self._frames[key]
+        path = self._read(self._path(kind, img_id, "npy"))
+        if path is None:
+            return None
+        img = np.load(path, mmap_mode="r")
+        self._keep_frame(key, img)
+        return img
+
+    def put_frame(self, kind: str, img_id: str, img: np.ndarray) -> np.ndarray:
+        """Store a decoded RGB frame and return its memory map"""
+        path = self._path(kind, img_id, "npy")
+        self._write(path, lambda f: np.save(f, img))
+        img = np.load(path, mmap_mode="r")
+        self._keep_frame((kind, img_id), img)
+        return img
+
+
+_cache = (
+    ImageCache(CAMERA_CACHE_DIR, CAMERA_CACHE_SIZE, CAMERA_CACHE_MEMORY)
+    if CAMERA_CACHE_DIR
+    else None
+)
+
+
+def get_image_cache() -> Optional[ImageCache]:
+    """Image cache shared by the process, None if CAMERA_CACHE_DIR is not set"""
+    return _cache
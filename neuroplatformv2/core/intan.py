@@ -1,15 +1,21 @@
 import grpc
+import time
+import zlib
+from contextlib import asynccontextmanager
 from grpc import RpcError
-from typing import List
+from typing import AsyncIterator, Dict, List, Optional
 
 from ..utils.constants import (
     INTAN_SERVICE_IP,
     INTAN_SERVICE_PORT,
 )
+from ..utils.enumerations import IntanPort
 from ..utils.exceptions import IntanConnectionError
 from ..utils.schemas import (
     CountDurationRequest,
     CountDurationResponse,
+    ExpNameRequest,
+    SetTagTriggerRequest,
     StartRawRecordingRequest,
     StimParam,
     ChannelVarThreshold,
@@ -17,6 +23,8 @@ from ..utils.schemas import (
     VarThresholdRequest,
     CoefThresholdRequest,
     StimParamRequest,
+    StimParamUpdateResponse,
+    TriggerTagsRequest,
     UploadStimParamRequest,
 )
 
@@ -29,11 +37,31 @@ from ..grpc.api_pb2 import (
     StatusReply,
     ChannelsArray,
     CountArray,
+    DebugInfo,
     Empty,
+    ExpName,
+    ExpNames,
     SaveInfo,
+    TriggersInfo,
 )
 from ..grpc.api_pb2_grpc import IntanServiceStub
 
+# Stim parameters loaded on the headstage by this process, by electrode.
+# Only _update_stimparam fills it: sending or uploading parameters directly
+# invalidates the electrodes they touch.
+_loaded_params: Dict[int, dict] = {}
+
+NB_TRIGGERS = 16
+
+
+def tag_from_label(label: str) -> int:
+    """uint32 trigger tag of a label (tweet id, experiment name), stable across runs.
+    It is a CRC32: different labels can share a tag, check the experiment name of
+    the recordings (or the time of the triggers) when it matters.
+    Tag 0 means untagged.
+    """
+    return zlib.crc32(label.encode())
+
 
 class IntanController:
     """Intan Software connection. Handle connection and can configure the software.
@@ -54,6 +82,21 @@ class IntanController:
             await self.channel.close()
             self.channel = None
 
+    @classmethod
+    @asynccontextmanager
+    async def _session(
+        cls, controller: Optional["IntanController"] = None
+    ) -> AsyncIterator["IntanController"]:
+        """The given long-lived controller, or a new one closed on exit"""
+        if controller is not None:
+            yield controller
+            return
+        controller = cls()
+        try:
+            yield controller
+        finally:
+            await controller._close()
+
     async def _var_threshold(
         self, channels_enabled: List[ChannelVarThreshold]
     ) -> StatusReply:
@@ -71,17 +114,16 @@ class IntanController:
         return status
 
     @classmethod
-    async def var_threshold(cls, req: VarThresholdRequest) -> str:
-        controller = cls()
-        try:
+    async def var_threshold(
+        cls, req: VarThresholdRequest, controller: Optional["IntanController"] = None
+    ) -> str:
+        async with cls._session(controller) as controller:
             status = await controller._var_threshold(req.channels)
             return (
                 "Auto variation threshold updated"
                 + ("" if status.status else "not")
                 + " successfully"
             )
-        finally:
-            await controller._close()
 
     async def _coef_threshold(
         self, channels_coef: List[ChannelCoefThreshold]
@@ -100,17 +142,16 @@ class IntanController:
         return status
 
     @classmethod
-    async def coef_threshold(cls, req: CoefThresholdRequest) -> str:
-        controller = cls()
-        try:
+    async def coef_threshold(
+        cls, req: CoefThresholdRequest, controller: Optional["IntanController"] = None
+    ) -> str:
+        async with cls._session(controller) as controller:
             status = await controller._coef_threshold(req.channels)
             return (
                 "Coef threshold updated"
                 + ("" if status.status else "not")
                 + " successfully"
             )
-        finally:
-            await controller._close()
 
     # async def _impedance(self):
     #     """Run impedance measurement"""
@@ -170,25 +211,88 @@ class IntanController:
     #     finally:
     #         controller._close()
 
-    # async def _set_tag_trigger(self, tag: int):
-    #     """
-    #     Set tag to trigger. It will be store in the database with all triggers
-    #     :type tag: int
-    #     """
-    #     data = np.empty(2, np.dtype("byte"))
-    #     data[0] = 16
-    #     data[1] = tag
-    #     data = data.tobytes()
-    #     await self._send(data, 2)
+    async def _set_trigger_tags(self, tags: List[int]) -> StatusReply:
+        """
+        Set the tag of each trigger key, stored in the database with the triggers
+        :type tags: List[int]
+            uint32 tag of the trigger keys 0 to 15
+        """
+        stub = IntanServiceStub(self.channel)
+        return await stub.triggertags(TriggersInfo(tags=tags))
 
-    # @classmethod
-    # async def set_tag_trigger(cls, req: SetTagTriggerRequest) -> str:
-    #     controller = cls()
-    #     try:
-    #         await controller._set_tag_trigger(req.tag)
-    #         return "Set tag to trigger successfully"
-    #     finally:
-    #         controller._close()
+    @classmethod
+    async def set_trigger_tags(
+        cls, req: TriggerTagsRequest, controller: Optional["IntanController"] = None
+    ) -> str:
+        async with cls._session(controller) as controller:
+            resp = await controller._set_trigger_tags(req.tags)
+            if resp.status:
+                return "Set tags to triggers successfully"
+            else:
+                return f"Error when setting tags to triggers: {resp.message}"
+
+    @classmethod
+    async def set_tag_trigger(
+        cls, req: SetTagTriggerRequest, controller: Optional["IntanController"] = None
+    ) -> str:
+        """Set the same tag to all the triggers"""
+        return await cls.set_trigger_tags(
+            TriggerTagsRequest(tags=[req.tag] * NB_TRIGGERS), controller
+        )
+
+    async def _set_exp_name(self, name: str, ports: List[IntanPort]) -> StatusReply:
+        """
+        Set the experiment name of the headstage ports, stored with their recordings
+        :type name: str
+        :type ports: List[IntanPort]
+        """
+        stub = IntanServiceStub(self.channel)
+        names = ExpNames(
+            update_expname=[ExpName(port=port.value, name=name) for port in ports]
+        )
+        return await stub.expname(names)
+
+    @classmethod
+    async def set_exp_name(
+        cls, req: ExpNameRequest, controller: Optional["IntanController"] = None
+    ) -> str:
+        async with cls._session(controller) as controller:
+            resp = await controller._set_exp_name(req.name, req.ports)
+            if resp.status:
+                return "Set experiment name successfully"
+            else:
+                return f"Error when setting experiment name: {resp.message}"
+
+    async def _tag(self, label: str, ports: List[IntanPort]) -> StatusReply:
+        """Tag the next triggers and the recordings with a label (tweet id, ...)"""
+        resp = await self._set_trigger_tags([tag_from_label(label)] * NB_TRIGGERS)
+        if not resp.status:
+            return resp
+        return await self._set_exp_name(label, ports)
+
+    async def _untag(self, ports: List[IntanPort]) -> StatusReply:
+        """Reset the trigger tags to 0 and clear the experiment name of the ports.
+        Tags persist on the board until changed.
+        """
+        resp = await self._set_trigger_tags([0] * NB_TRIGGERS)
+        if not resp.status:
+            return resp
+        return await self._set_exp_name("", ports)
+
+    async def _debug_info(self, timeout: Optional[float] = None) -> DebugInfo:
+        """State of the acquisition loop of the Intan software
+        :type timeout: float, optional
+            Seconds before the call fails
+        """
+        stub = IntanServiceStub(self.channel)
+        return await stub.debuginfo(Empty(), timeout=timeout)
+
+    @classmethod
+    async def debug_info(
+        cls, controller: Optional["IntanController"] = None
+    ) -> DebugInfo:
+        async with cls._session(controller) as controller:
+            return await controller._debug_info()
 
     async def _count_spike(self, duration: int) -> List[int]:
         """Count the number of spike during the interval
@@ -202,12 +306,11 @@ class IntanController:
         return resp.counts
 
     @classmethod
-    async def count_spike(cls, req: CountDurationRequest) -> CountDurationResponse:
-        controller = cls()
-        try:
+    async def count_spike(
+        cls, req: CountDurationRequest, controller: Optional["IntanController"] = None
+    ) -> CountDurationResponse:
+        async with cls._session(controller) as controller:
             return await controller._count_spike(req.duration)
-        finally:
-            await controller._close()
 
     async def _upload_stimparam(self, electrodes: List[int] = None) -> StatusReply:
         """Upload the stim parameter to the headstage. Must stop the board to upload the parameter.
@@ -218,8 +321,11 @@ class IntanController:
         status = StatusReply(status=True, message=None)
 
         if electrodes is None:
+            _loaded_params.clear()
             channels = ChannelsArray(channels=[])
         else:
+            for index in electrodes:
+                _loaded_params.pop(index, None)
             channels = ChannelsArray(channels=electrodes)
         resp = await stub.updatestimparam(channels)
         if not resp.status:
@@ -228,12 +334,13 @@ class IntanController:
         return status
 
     @classmethod
-    async def upload_stimparam(cls, req: UploadStimParamRequest) -> None:
-        controller = cls()
-        try:
+    async def upload_stimparam(
+        cls,
+        req: UploadStimParamRequest,
+        controller: Optional["IntanController"] = None,
+    ) -> None:
+        async with cls._session(controller) as controller:
             await controller._upload_stimparam(req.electrodes)
-        finally:
-            await controller._close()
 
     async def _send_stimparam(self, params: List[StimParam]) -> StatusReply:
         """Send a list of stim parameter to intan software
@@ -242,6 +349,7 @@ class IntanController:
         stub = IntanServiceStub(self.channel)
         status = StatusReply(status=True, message=None)
         for param in params:
+            _loaded_params.pop(param.index, None)
             sp = param.to_grpc()
             resp = await stub.stimparam(sp)
             if not resp.status:
@@ -253,12 +361,58 @@ class IntanController:
         return status
 
     @classmethod
-    async def send_stimparam(cls, req: StimParamRequest) -> None:
-        controller = cls()
-        try:
+    async def send_stimparam(
+        cls, req: StimParamRequest, controller: Optional["IntanController"] = None
+    ) -> None:
+        async with cls._session(controller) as controller:
             await controller._send_stimparam(req.params)
-        finally:
-            await controller._close()
+
+    async def _update_stimparam(
+        self, params: List[StimParam]
+    ) -> StimParamUpdateResponse:
+        """Send and upload only the parameters that differ from the loaded ones.
+        Updating with the parameters already loaded does not stop the board.
+        :type params: List[StimParam]
+        """
+        changed = [
+            param
+            for param in params
+            if _loaded_params.get(param.index) != param.model_dump()
+        ]
+        if not changed:
+            return StimParamUpdateResponse(status=True)
+        electrodes = [param.index for param in changed]
+
+        # Send a full copy, to_grpc only sends the fields changed since the last call
+        status = await self._send_stimparam(
+            [StimParam(**param.model_dump()) for param in changed]
+        )
+        if not status.status:
+            return StimParamUpdateResponse(
+                status=False, message=status.message, changed=electrodes
+            )
+
+        # _send_stimparam and _upload_stimparam invalidate the electrodes until
+        # the upload succeeds
+        start = time.monotonic()
+        status = await self._upload_stimparam(electrodes)
+        downtime = time.monotonic() - start
+        if status.status:
+            for param in changed:
+                _loaded_params[param.index] = param.model_dump()
+        return StimParamUpdateResponse(
+            status=status.status,
+            message=status.message,
+            changed=electrodes,
+            downtime=downtime,
+        )
+
+    @classmethod
+    async def update_stimparam(
+        cls, req: StimParamRequest, controller: Optional["IntanController"] = None
+    ) -> StimParamUpdateResponse:
+        async with cls._session(controller) as controller:
+            return await controller._update_stimparam(req.params)
 
     async def _start_raw_recording(
         self, channels: List[int], tag: str, triggers: bool
@@ -277,9 +431,12 @@ class IntanController:
         return await stub.startrecording(saveinfo)
 
     @classmethod
-    async def start_raw_recording(cls, req: StartRawRecordingRequest) -> str:
-        controller = cls()
-        try:
+    async def start_raw_recording(
+        cls,
+        req: StartRawRecordingRequest,
+        controller: Optional["IntanController"] = None,
+    ) -> str:
+        async with cls._session(controller) as controller:
             resp: StatusReply = await controller._start_raw_recording(
                 req.channels, req.tag, req.triggers
             )
@@ -287,8 +444,6 @@ class IntanController:
                 return "Raw recording with the selected channels started successfully"
             else:
                 return "Error when starting raw recording"
-        finally:
-            await controller._close()
 
     async def _stop_raw_recording(self) -> StatusReply:
         """
@@ -298,16 +453,15 @@ class IntanController:
         return await stub.stoprecording(Empty())
 
     @classmethod
-    async def stop_raw_recording(cls) -> str:
-        controller = cls()
-        try:
+    async def stop_raw_recording(
+        cls, controller: Optional["IntanController"] = None
+    ) -> str:
+        async with cls._session(controller) as controller:
             resp: StatusReply = await controller._stop_raw_recording()
             if resp.status:
                 return "Raw recording stopped successfully"
             else:
                 return "Error when stopping raw recording"
-        finally:
-            await controller._close()
 
 
 async def var_threshold(req: VarThresholdRequest) -> str:
@@ -328,9 +482,19 @@ async def var_threshold(req: VarThresholdRequest) -> str:
 #     return await IntanController.read_count()
 
 
-# async def set_tag_trigger(req: SetTagTriggerRequest) -> str:
-#     validator = SetTagTriggerRequest(tag=req)
-#     return await IntanController.set_tag_trigger(validator)
+async def set_tag_trigger(req: SetTagTriggerRequest) -> str:
+    validator = SetTagTriggerRequest(tag=req.tag)
+    return await IntanController.set_tag_trigger(validator)
+
+
+async def set_trigger_tags(req: TriggerTagsRequest) -> str:
+    validator = TriggerTagsRequest(tags=req.tags)
+    return await IntanController.set_trigger_tags(validator)
+
+
+async def set_exp_name(req: ExpNameRequest) -> str:
+    validator = ExpNameRequest(name=req.name, ports=req.ports)
+    return await IntanController.set_exp_name(validator)
 
 
 # async def send_stimparam(req: StimParamRequest) -> None:
@@ -1,115 +1,142 @@
-from typing import Union
-
-import requests
+import asyncio
+from typing import Dict, Optional, Union
 
 from ..utils.constants import PUMP_1_IP, PUMP_2_IP, PUMP_3_IP, PUMP_PORT
 from ..utils.enumerations import PeristalticDirection, PumpId
 from ..utils.schemas import (
     PeristalticRequest,
+    PeristalticRpmAllRequest,
     PeristalticRpmRequest,
     PeristalticState,
 )
+from .http import HTTPClient, get_http_client
+
+_PUMP_IPS = {
+    PumpId.One: PUMP_1_IP,
+    PumpId.Two: PUMP_2_IP,
+    PumpId.Three: PUMP_3_IP,
+}
 
 
 class PeristalticController:
     """Control the peristaltic pump."""
 
-    def __init__(self, id_pump: PumpId):
+    def __init__(self, id_pump: PumpId, client: Optional[HTTPClient] = None):
         """:param id_pump: id pump [1,2,3]"""
-        self.id_pump = id_pump
+        try:
+            self.id_pump = PumpId(id_pump)
+        except ValueError:
+            raise ValueError("id pump not [1,2,3]")
+        self._client = client or get_http_client()
 
     def _url(self, str: str):
         """Get url for the pump."""
-        if self.id_pump == 1:
-            url = f"http://{PUMP_1_IP}:{PUMP_PORT}/{str}/1"
-        elif self.id_pump == 2:
-            url = f"http://{PUMP_2_IP}:{PUMP_PORT}/{str}/2"
-        elif self.id_pump == 3:
-            url = f"http://{PUMP_3_IP}:{PUMP_PORT}/{str}/3"
-        else:
-            raise ValueError("id pump not [1,2,3]")
-
-        return url
+        ip = _PUMP_IPS[self.id_pump]
+        return f"http://{ip}:{PUMP_PORT}/{str}/{self.id_pump.value}"
 
-    def _start(self):
+    async def _start(self):
         """Start the pump"""
-        url = self._url("start")
-        r = requests.get(url)
-        if r.status_code == 200:
-            return True
-        else:
-            return False
+        r = await self._client.get(self._url("start"))
+        return r.status_code == 200
 
     @classmethod
-    def start(cls, req: PeristalticRequest) -> bool:
+    async def start(cls, req: PeristalticRequest) -> bool:
         controller = cls(req.pump_id)
-        return controller._start()
+        return await controller._start()
 
-    def _stop(self):
+    async def _stop(self):
         """Stop the pump"""
-        url = self._url("stop")
-        r = requests.get(url)
-        if r.status_code == 200:
-            return True
-        else:
-            return False
+        r = await self._client.get(self._url("stop"))
+        return r.status_code == 200
 
     @classmethod
-    def stop(cls, req: PeristalticRequest) -> bool:
+    async def stop(cls, req: PeristalticRequest) -> bool:
         controller = cls(req.pump_id)
-        return controller._stop()
+        return await controller._stop()
 
-    def _rpm(self, speed: float, direction: PeristalticDirection):
+    async def _rpm(self, speed: float, direction: PeristalticDirection):
         """Set RPM speed and direction
         :type speed: float
         :type direction: PeristalticDirection
-        Returns:
-            PeristalticState: An instance of PeristalticState
         """
-        url = self._url("set")
-        r = requests.post(url, json={"rpm": speed, "direction": direction.value})
-        if r.status_code == 200:
-            return True
-        else:
-            return False
+        r = await self._client.post(
+            self._url("set"), json={"rpm": speed, "direction": direction.value}
+        )
+        return r.status_code == 200
 
     @classmethod
-    def rpm(cls, req: PeristalticRpmRequest) -> bool:
+    async def rpm(cls, req: PeristalticRpmRequest) -> bool:
         controller = cls(req.pump_id)
-        return controller._rpm(req.speed, req.direction)
+        return await controller._rpm(req.speed, req.direction)
 
-    def _info(self) -> Union["PeristalticState", None]:
+    async def _info(self) -> Union["PeristalticState", None]:
         """State of the pump"""
-        url = self._url("info")
-        r = requests.get(url)
+        r = await self._client.get(self._url("info"))
         if r.status_code == 200:
             return PeristalticState.from_dict(r.json())
         else:
             return None
 
     @classmethod
-    def info(cls, req: PeristalticRequest) -> Union["PeristalticState", None]:
+    async def info(cls, req: PeristalticRequest) -> Union["PeristalticState", None]:
         controller = cls(req.pump_id)
-        return controller._info()
+        return await controller._info()
+
+    # MARK: All the pumps at once
 
+    @classmethod
+    async def _fan_out(cls, call) -> Dict[PumpId, object]:
+        """Run call(controller) on the three pumps concurrently"""
+        pumps = list(PumpId)
+        results = await asyncio.gather(*[call(cls(pump)) for pump in pumps])
+        return dict(zip(pumps, results))
 
-def start_peristaltic(req: PeristalticRequest) -> bool:
+    @classmethod
+    async def start_all(cls) -> Dict[PumpId, bool]:
+        return await cls._fan_out(lambda controller: controller._start())
+
+    @classmethod
+    async def stop_all(cls) -> Dict[PumpId, bool]:
+        return await cls._fan_out(lambda controller: controller._stop())
+
+    @classmethod
+    async def rpm_all(cls, req: PeristalticRpmAllRequest) -> Dict[PumpId, bool]:
+        return await cls._fan_out(
+            lambda controller: controller._rpm(req.speed, req.direction)
+        )
+
+    @classmethod
+    async def info_all(cls) -> Dict[PumpId, Union["PeristalticState", None]]:
+        """State of the three pumps, None for a pump that did not answer 200"""
+        return await cls._fan_out(lambda controller: controller._info())
+
+
+async def start_peristaltic(req: PeristalticRequest) -> bool:
     validator = PeristalticRequest(pump_id=req.pump_id)
-    return PeristalticController.start(validator)
+    return await PeristalticController.start(validator)
 
 
-def stop_peristaltic(req: PeristalticRequest) -> bool:
+async def stop_peristaltic(req: PeristalticRequest) -> bool:
     validator = PeristalticRequest(pump_id=req.pump_id)
-    return PeristalticController.stop(validator)
+    return await PeristalticController.stop(validator)
 
 
-def rpm(req: PeristalticRpmRequest) -> bool:
+async def rpm(req: PeristalticRpmRequest) -> bool:
     validator = PeristalticRpmRequest(
         speed=req.speed, direction=req.direction, pump_id=req.pump_id
     )
-    return PeristalticController.rpm(validator)
+    return await PeristalticController.rpm(validator)
 
 
-def info(req: PeristalticRequest) -> "PeristalticState":
+async def info(req: PeristalticRequest) -> "PeristalticState":
     validator = PeristalticRequest(pump_id=req.pump_id)
-    return PeristalticController.info(validator)
+    return await PeristalticController.info(validator)
+
+
+async def rpm_all(req: PeristalticRpmAllRequest) -> Dict[PumpId, bool]:
+    validator = PeristalticRpmAllRequest(speed=req.speed, direction=req.direction)
+    return await PeristalticController.rpm_all(validator)
+
+
+async def info_all() -> Dict[PumpId, Union["PeristalticState", None]]:
+    return await PeristalticController.info_all()
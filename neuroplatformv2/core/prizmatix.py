@@ -1,31 +1,33 @@
-import requests
+from typing import Optional
 
 from ..utils.constants import (
     INTAN_SERVICE_IP,
     PRIZMATIX_PORT,
 )
+from .http import HTTPClient, get_http_client
 
 
 class PrizmatixController:
     """Control the Prizmatix UV led"""
 
+    def __init__(self, client: Optional[HTTPClient] = None):
+        self._client = client or get_http_client()
+
+    async def _send(self, command: str) -> bool:
+        r = await self._client.get(
+            f"http://{INTAN_SERVICE_IP}:{PRIZMATIX_PORT}/{command}"
+        )
+        return r.status_code == 200
+
     @classmethod
     async def start(cls) -> bool:
         """Start the device"""
-        r = requests.get(f"http://{INTAN_SERVICE_IP}:{PRIZMATIX_PORT}/start")
-        if r.status_code == 200:
-            return True
-        else:
-            return False
+        return await cls()._send("start")
 
     @classmethod
     async def stop(cls) -> bool:
         """Stop the device"""
-        r = requests.get(f"http://{INTAN_SERVICE_IP}:{PRIZMATIX_PORT}/stop")
-        if r.status_code == 200:
-            return True
-        else:
-            return False
+        return await cls()._send("stop")
 
 
 async def start_prizmatix() -> bool:
@@ -0,0 +1,182 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..utils.constants import PUMP_POLL_HISTORY, PUMP_POLL_INTERVAL, PUMP_POLL_QUEUE
+from ..utils.enumerations import PeristalticDirection, PumpId
+from ..utils.schemas import PeristalticState
+from .http import HTTPClient
+from .peristaltic import PeristalticController
+
+# One sample of a pump in the history
+PUMP_STATE_DTYPE = np.dtype(
+    [
+        ("time", "f8"),
+        ("rpm", "f4"),
+        ("running", "?"),
+        ("direction", "u1"),
+        ("prime", "?"),
+    ]
+)
+
+
+class PumpPoller:
+    """Sample the state of the pumps in the background.
+
+    The states are kept in a ring buffer of `size` samples per pump, and the latest
+    one in memory with its time, so readers never wait for a pump. Subscribers
+    receive the (pump, state) of each change of state; a subscriber that does not
+    keep up loses its oldest changes.
+    """
+
+    def __init__(
+        self,
+        interval: float = PUMP_POLL_INTERVAL,
+        size: int = PUMP_POLL_HISTORY,
+        client: Optional[HTTPClient] = None,
+    ):
+        self._interval = interval
+        self._controllers = {
+            pump: PeristalticController(pump, client) for pump in PumpId
+        }
+        self._history = {
+            pump: np.zeros(size, dtype=PUMP_STATE_DTYPE) for pump in PumpId
+        }
+        self._count = {pump: 0 for pump in PumpId}
+        self._latest: Dict[PumpId, PeristalticState] = {}
+        self._sampled: Dict[PumpId, float] = {}
+        self._subscribers: List[asyncio.Queue] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def _record(self, pump: PumpId, state: PeristalticState, now: float):
+        history = self._history[pump]
+        history[self._count[pump] % len(history)] = (
+            now,
+            state.rpm,
+            state.running,
+            state.direction.value,
+            state.prime,
+        )
+        self._count[pump] += 1
+        self._sampled[pump] = now
+
+        if self._latest.get(pump) != state:
+            self._latest[pump] = state
+            for queue in self._subscribers:
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait((pump, state))
+
+    async def poll(self):
+        """Sample all the pumps once. A pump that fails keeps its last state."""
+        pumps = list(self._controllers)
+        states = await asyncio.gather(
+            *[self._controllers[pump]._info() for pump in pumps],
+            return_exceptions=True,
+        )
+        now = time.time()
+        for pump, state in zip(pumps, states):
+            if isinstance(state, PeristalticState):
+                self._record(pump, state, now)
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await self.poll()
+            await asyncio.sleep(max(self._interval - (time.monotonic() - started), 0))
+
+    def start(self):
+        """Start polling in the running loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def stale_after(self) -> float:
+        """Age in seconds of a sample after a few missed polls"""
+        return 3 * self._interval
+
+    def age(self, pump: PumpId) -> Optional[float]:
+        """Seconds since the last sample of the pump, None if never sampled"""
+        sampled = self._sampled.get(PumpId(pump))
+        return None if sampled is None else time.time() - sampled
+
+    def latest(
+        self, pump: PumpId, max_age: Optional[float] = None
+    ) -> Optional[PeristalticState]:
+        """Last state of the pump, None if never sampled or older than max_age
+        seconds (the pump stopped answering)
+        """
+        age = self.age(pump)
+        if age is None or (max_age is not None and age > max_age):
+            return None
+        return self._latest.get(PumpId(pump))
+
+    def history(self, pump: PumpId) -> np.ndarray:
+        """Samples of the pump in the ring buffer, oldest first"""
+        pump = PumpId(pump)
+        history, count = self._history[pump], self._count[pump]
+        if count <= len(history):
+            return history[:count].copy()
+        return np.roll(history, -(count % len(history)))
+
+    def states(self, pump: PumpId) -> List[PeristalticState]:
+        """History of the pump as PeristalticState"""
+        return [
+            PeristalticState(
+                rpm=float(sample["rpm"]),
+                running=bool(sample["running"]),
+                direction=PeristalticDirection(int(sample["direction"])),
+                prime=bool(sample["prime"]),
+            )
+            for sample in self.history(pump)
+        ]
+
+    def subscribe(self, maxsize: int = PUMP_POLL_QUEUE) -> asyncio.Queue:
+        """Queue receiving the (pump, state) of each change, the oldest changes are
+        dropped when it holds maxsize of them
+        """
+        queue = asyncio.Queue(maxsize)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.remove(queue)
+
+    async def wait_change(
+        self, pump: Optional[PumpId] = None, timeout: Optional[float] = None
+    ) -> Tuple[PumpId, PeristalticState]:
+        """Wait for the next change of a pump, or of any pump if pump is None.
+        The timeout bounds the whole wait, changes of other pumps included."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        queue = self.subscribe()
+        try:
+            while True:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                changed, state = await asyncio.wait_for(queue.get(), remaining)
+                if pump is None or changed == PumpId(pump):
+                    return changed, state
+        finally:
+            self.unsubscribe(queue)
+
+
+_poller = PumpPoller()
+
+
+def get_pump_poller() -> PumpPoller:
+    """Pump poller shared by the process, started with start()"""
+    return _poller
@@ -0,0 +1,201 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .archive import Interval, as_utc, merge_intervals, missing_intervals
+
+CacheKey = Tuple[str, str]
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _to_us(date: datetime) -> int:
+    return (date - EPOCH) // timedelta(microseconds=1)
+
+
+def _from_us(us: int) -> datetime:
+    return EPOCH + timedelta(microseconds=us)
+
+
+class QueryCache:
+    """Cache of immutable query results, keyed by (bucket, filter, start, stop).
+
+    A request is split into the sub-ranges already cached and the missing ones;
+    only the missing ones are queried, then everything is merged. The segments of
+    a key never overlap: a query result only fills what is still missing when it
+    is stored, and adjacent segments are merged while they stay small. The frames
+    kept in memory are bounded by `max_bytes` with LRU eviction. If `directory` is
+    set, the results are also pickled to disk and survive evictions and restarts.
+    """
+
+    def __init__(self, max_bytes: int, directory: Optional[str] = None):
+        self._max_bytes = max_bytes
+        self._directory = directory
+        self._frames: "OrderedDict[Tuple[CacheKey, Interval], pd.DataFrame]" = (
+            OrderedDict()
+        )
+        self._segments: Dict[CacheKey, List[Interval]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _key_dir(self, key: CacheKey) -> str:
+        digest = hashlib.sha1("|".join(key).encode()).hexdigest()
+        return os.path.join(self._directory, digest)
+
+    def _segment_path(self, key: CacheKey, segment: Interval) -> str:
+        start, stop = segment
+        name = f"{_to_us(start)}_{_to_us(stop)}.pkl"
+        return os.path.join(self._key_dir(key), name)
+
+    def _load_segments(self, key: CacheKey) -> List[Interval]:
+        """Segments of the key, read from the disk the first time"""
+        if key in self._segments:
+            return self._segments[key]
+        segments = []
+        if self._directory is not None and os.path.isdir(self._key_dir(key)):
+            for name in os.listdir(self._key_dir(key)):
+                if not name.endswith(".pkl"):
+                    continue
+                start_us, stop_us = name[:-4].split("_")
+                segments.append((_from_us(int(start_us)), _from_us(int(stop_us))))
+        self._segments[key] = sorted(segments)
+        return self._segments[key]
+
+    def _get(self, key: CacheKey, segment: Interval) -> Optional[pd.DataFrame]:
+        entry = (key, segment)
+        if entry in self._frames:
+            self._frames.move_to_end(entry)
+            return self._frames[entry]
+        if self._directory is not None:
+            path = self._segment_path(key, segment)
+            if os.path.exists(path):
+                df = pd.read_pickle(path)
+                self._keep(entry, df)
+                return df
+        return None
+
+    def _keep(self, entry: Tuple[CacheKey, Interval], df: pd.DataFrame):
+        """Keep the frame in memory and evict the least recently used ones"""
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self._max_bytes:
+            return
+        self._frames[entry] = df
+        self._bytes += size
+        while self._bytes > self._max_bytes:
+            (key, segment), old = self._frames.popitem(last=False)
+            self._bytes -= int(old.memory_usage(deep=True).sum())
+            if self._directory is None:
+                self._segments[key].remove(segment)
+
+    def _remove(self, key: CacheKey, segment: Interval):
+        df = self._frames.pop((key, segment), None)
+        if df is not None:
+            self._bytes -= int(df.memory_usage(deep=True).sum())
+        if self._directory is not None:
+            path = self._segment_path(key, segment)
+            if os.path.exists(path):
+                os.remove(path)
+        if segment in self._segments.get(key, []):
+            self._segments[key].remove(segment)
+
+    def _store(self, key: CacheKey, segment: Interval, df: pd.DataFrame):
+        if self._directory is not None:
+            path = self._segment_path(key, segment)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            df.to_pickle(path)
+        self._load_segments(key).append(segment)
+        self._segments[key].sort()
+        self._keep((key, segment), df)
+
+    def _merge(self, key: CacheKey, segment: Interval):
+        """Merge the segment with its adjacent segments while they stay small"""
+        limit = self._max_bytes // 8
+        for neighbour in list(self._segments[key]):
+            if segment not in self._segments[key]:
+                return
+            if neighbour[1] != segment[0] and neighbour[0] != segment[1]:
+                continue
+            first, second = sorted([neighbour, segment])
+            frames = [self._get(key, first), self._get(key, second)]
+            if any(df is None for df in frames):
+                continue
+            size = sum(int(df.memory_usage(deep=True).sum()) for df in frames)
+            if size > limit:
+                continue
+            merged = pd.concat(
+                [df for df in frames if len(df.index) > 0] or frames[:1],
+                ignore_index=True,
+            )
+            self._remove(key, first)
+            self._remove(key, second)
+            segment = (first[0], second[1])
+            self._store(key, segment, merged)
+
+    def _put(
+        self,
+        key: CacheKey,
+        segment: Interval,
+        df: pd.DataFrame,
+        time_column: str,
+    ):
+        """Store the parts of the result not cached by a concurrent fetch meanwhile"""
+        start, stop = segment
+        segments = self._load_segments(key)
+        covered = merge_intervals([s for s in segments if s[0] < stop and s[1] > start])
+        for gap in missing_intervals(covered, start, stop):
+            part = df
+            if gap != segment and len(df.index) > 0:
+                times = pd.to_datetime(df[time_column], utc=True)
+                inside = (times >= pd.Timestamp(gap[0])) & (times < pd.Timestamp(gap[1]))
+                part = df[inside]
+            self._store(key, gap, part)
+            self._merge(key, gap)
+
+    def fetch(
+        self,
+        bucket: str,
+        filter: str,
+        start: datetime,
+        stop: datetime,
+        query: Callable[[datetime, datetime], pd.DataFrame],
+        time_column: str = "Time",
+        sort_by: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """Get [start, stop), querying only the sub-ranges not in the cache.
+        :type query: Callable
+            query(start, stop) of the database for the bucket and filter
+        :type time_column: str
+            Column used to cut the cached results to [start, stop)
+        """
+        key = (bucket, filter)
+        start, stop = as_utc(start), as_utc(stop)
+        parts = []
+        with self._lock:
+            segments = self._load_segments(key)
+            hits = [seg for seg in segments if seg[0] < stop and seg[1] > start]
+            for segment in hits:
+                df = self._get(key, segment)
+                if df is None:
+                    segments.remove(segment)
+                else:
+                    parts.append(df)
+            covered = merge_intervals([seg for seg in hits if seg in segments])
+
+        for gap in missing_intervals(covered, start, stop):
+            df = query(*gap)
+            with self._lock:
+                self._put(key, gap, df, time_column)
+            parts.append(df)
+
+        parts = [df for df in parts if len(df.index) > 0]
+        if not parts:
+            return pd.DataFrame()
+        df = pd.concat(parts, ignore_index=True)
+        times = pd.to_datetime(df[time_column], utc=True)
+        df = df[(times >= pd.Timestamp(start)) & (times < pd.Timestamp(stop))]
+        return df.sort_values(by=sort_by or [time_column], ignore_index=True)
@@ -0,0 +1,205 @@
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from ..utils.constants import RECORDING_DIR, RECORDING_SAMPLE_RATE
+from ..utils.schemas import RecordingEntry
+from .archive import as_utc
+
+# Files of a recording, one file per signal type:
+# amplifier.dat: int16 samples, channels interleaved
+# time.dat: int32 sample counter of each sample
+# digitalin.dat: uint16 word of the digital inputs (triggers) of each sample
+AMPLIFIER_FILE = "amplifier.dat"
+TIME_FILE = "time.dat"
+DIGITAL_FILE = "digitalin.dat"
+INDEX_FILE = "index.npz"
+
+# Amplifier resolution in uV per bit
+AMPLIFIER_SCALE = 0.195
+
+# Samples read at a time when building the index
+INDEX_BLOCK = 1 << 20
+
+
+def to_microvolts(data: np.ndarray) -> np.ndarray:
+    """Convert amplifier samples to uV (copies the data)"""
+    return data.astype(np.float32) * np.float32(AMPLIFIER_SCALE)
+
+
+class RawRecording:
+    """Raw recording read with memory maps, nothing is loaded until it is accessed.
+
+    A sidecar index (index.npz) holds the segments of contiguous sample counter
+    and the rising edges of the digital inputs. It is built once by a pass over
+    time.dat and digitalin.dat, then windows around the triggers only read the
+    pages of the windows.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        channels: List[int],
+        sample_rate: int = RECORDING_SAMPLE_RATE,
+        start: Optional[datetime] = None,
+    ):
+        self._path = path
+        self.channels = list(channels)
+        self.sample_rate = sample_rate
+        self.start = as_utc(start) if start is not None else None
+        self._columns = {channel: i for i, channel in enumerate(self.channels)}
+
+        self.amplifier = np.memmap(
+            os.path.join(path, AMPLIFIER_FILE), dtype=np.int16, mode="r"
+        ).reshape(-1, len(self.channels))
+        self.time = np.memmap(os.path.join(path, TIME_FILE), dtype=np.int32, mode="r")
+        digital = os.path.join(path, DIGITAL_FILE)
+        self.digital = (
+            np.memmap(digital, dtype=np.uint16, mode="r")
+            if os.path.exists(digital)
+            else None
+        )
+        self._segments: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._triggers: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @classmethod
+    def from_entry(
+        cls, entry: RecordingEntry, directory: str = RECORDING_DIR
+    ) -> "RawRecording":
+        """Open a recording of the RecordingIndex, stored in directory/tag"""
+        return cls(
+            os.path.join(directory, entry.tag), entry.channels, start=entry.start
+        )
+
+    def __len__(self) -> int:
+        return min(len(self.amplifier), len(self.time))
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds"""
+        return len(self) / self.sample_rate
+
+    def channel(self, channel: int) -> np.ndarray:
+        """Samples of a channel, as a strided view of the memory map"""
+        return self.amplifier[: len(self), self._columns[channel]]
+
+    def __getitem__(self, key) -> np.ndarray:
+        """Samples x channels view, e.g. recording[start:stop]"""
+        return self.amplifier[: len(self)][key]
+
+    # MARK: Sidecar index
+
+    def _index_path(self) -> str:
+        return os.path.join(self._path, INDEX_FILE)
+
+    def _build_index(self):
+        """One pass by blocks over the time and digital inputs"""
+        n = len(self)
+        seg_samples, seg_times = [], []
+        trig_samples, trig_words = [], []
+        prev_time, prev_word = None, 0
+        for offset in range(0, n, INDEX_BLOCK):
+            stop = min(offset + INDEX_BLOCK, n)
+            times = np.asarray(self.time[offset:stop], dtype=np.int64)
+            starts = np.flatnonzero(np.diff(times) != 1) + 1
+            if prev_time is None or times[0] != prev_time + 1:
+                starts = np.concatenate([[0], starts])
+            seg_samples.append(starts + offset)
+            seg_times.append(times[starts])
+            prev_time = times[-1]
+
+            if self.digital is not None:
+                words = np.asarray(self.digital[offset:stop])
+                previous = np.concatenate([[prev_word], words[:-1]]).astype(np.uint16)
+                rising = words & ~previous
+                edges = np.flatnonzero(rising)
+                trig_samples.append(edges + offset)
+                trig_words.append(rising[edges])
+                prev_word = words[-1]
+
+        def _cat(parts, dtype):
+            return np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype)
+
+        self._segments = (_cat(seg_samples, np.int64), _cat(seg_times, np.int64))
+        self._triggers = (_cat(trig_samples, np.int64), _cat(trig_words, np.uint16))
+        np.savez(
+            self._index_path(),
+            length=n,
+            segment_samples=self._segments[0],
+            segment_times=self._segments[1],
+            trigger_samples=self._triggers[0],
+            trigger_words=self._triggers[1],
+        )
+
+    def _load_index(self):
+        if self._segments is not None:
+            return
+        if os.path.exists(self._index_path()):
+            with np.load(self._index_path()) as index:
+                # The index of a recording still being written is rebuilt
+                if int(index["length"]) == len(self):
+                    self._segments = (index["segment_samples"], index["segment_times"])
+                    self._triggers = (index["trigger_samples"], index["trigger_words"])
+                    return
+        self._build_index()
+
+    def sample_of(self, timestamp: int) -> int:
+        """Position of the sample with this sample counter"""
+        self._load_index()
+        samples, times = self._segments
+        i = max(np.searchsorted(times, timestamp, side="right") - 1, 0)
+        return int(samples[i] + timestamp - times[i])
+
+    def sample_at(self, date: datetime) -> int:
+        """Position of the sample at this date (needs the start of the recording)"""
+        if self.start is None:
+            raise ValueError("Start of the recording is unknown")
+        seconds = (as_utc(date) - self.start).total_seconds()
+        return int(round(seconds * self.sample_rate))
+
+    def triggers(self, trigger: Optional[int] = None) -> np.ndarray:
+        """Positions of the rising edges of the digital inputs, or of one input"""
+        self._load_index()
+        samples, words = self._triggers
+        if trigger is None:
+            return samples
+        return samples[(words >> trigger) & 1 == 1]
+
+    # MARK: Windows
+
+    def windows(
+        self,
+        samples: np.ndarray,
+        before: float,
+        after: float,
+        channels: Optional[List[int]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Windows [sample - before, sample + after) in seconds.
+        Only the pages of the windows are read. Windows not fully inside the
+        recording are dropped.
+        :return: windows x samples x channels array and the samples of the windows
+        """
+        first = -int(round(before * self.sample_rate))
+        last = int(round(after * self.sample_rate))
+        samples = np.asarray(samples, dtype=np.int64)
+        samples = samples[(samples + first >= 0) & (samples + last <= len(self))]
+        if channels is None:
+            channels = self.channels
+        columns = [self._columns[channel] for channel in channels]
+
+        data = np.empty((len(samples), last - first, len(columns)), dtype=np.int16)
+        for i, sample in enumerate(samples):
+            data[i] = self.amplifier[sample + first : sample + last, columns]
+        return data, samples
+
+    def trigger_windows(
+        self,
+        before: float = 0.05,
+        after: float = 0.05,
+        trigger: Optional[int] = None,
+        channels: Optional[List[int]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Windows around the triggers (100 ms by default)"""
+        return self.windows(self.triggers(trigger), before, after, channels)
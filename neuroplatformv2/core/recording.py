@@ -0,0 +1,237 @@
+import asyncio
+import bisect
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
+
+from ..utils.constants import (
+    RECORDING_MAX_BYTES,
+    RECORDING_MAX_DELAY,
+    RECORDING_MAX_DURATION,
+    RECORDING_MIN_GAP,
+    RECORDING_SAMPLE_RATE,
+)
+from ..utils.enumerations import Resource
+from ..utils.exceptions import IntanRecordingError
+from ..utils.schemas import RecordingEntry
+from .archive import as_utc
+from .intan import IntanController
+from .scheduler import ResourceScheduler, get_scheduler
+from .trigger import last_trigger
+
+# int16 per channel and sample, plus the int32 timestamp of the sample
+BYTES_PER_SAMPLE = 2
+TIMESTAMP_BYTES = 4
+
+
+class RecordingIndex:
+    """Index of the recording files (tag, start, stop, channels) in a JSON lines file.
+    Entries are kept sorted by start, so the files of a time range are found by
+    bisection.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._entries: List[RecordingEntry] = []
+        if os.path.exists(path):
+            with open(path) as f:
+                self._entries = [
+                    RecordingEntry.model_validate_json(line)
+                    for line in f
+                    if line.strip()
+                ]
+            self._entries.sort(key=lambda entry: entry.start)
+        self._starts = [entry.start for entry in self._entries]
+
+    def add(self, entry: RecordingEntry):
+        os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+        with open(self._path, "a") as f:
+            f.write(entry.model_dump_json() + "\n")
+        i = bisect.bisect_right(self._starts, entry.start)
+        self._entries.insert(i, entry)
+        self._starts.insert(i, entry.start)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def overlapping(self, start: datetime, stop: datetime) -> List[RecordingEntry]:
+        """Files with data in [start, stop)"""
+        start, stop = as_utc(start), as_utc(stop)
+        end = bisect.bisect_left(self._starts, stop)
+        return [entry for entry in self._entries[:end] if entry.stop > start]
+
+    def by_tag(self, tag: str) -> Optional[RecordingEntry]:
+        return next((entry for entry in self._entries if entry.tag == tag), None)
+
+
+class RecordingSession:
+    """Raw recording rotated into several files.
+
+    A new file is started when the current one reaches max_duration seconds or
+    about max_bytes. The rotation waits, at most max_delay seconds, for a gap of
+    min_gap seconds since the last trigger sent by the process and outside of
+    stimulation() blocks, then holds the Intan and Trigger locks of the scheduler,
+    so no trigger falls between two files. Each finished file is added to the
+    index. A failed rotation is reported in `error` and retried.
+    """
+
+    def __init__(
+        self,
+        channels: List[int],
+        index: RecordingIndex,
+        prefix: str = "rec",
+        triggers: bool = True,
+        max_duration: float = RECORDING_MAX_DURATION,
+        max_bytes: int = RECORDING_MAX_BYTES,
+        min_gap: float = RECORDING_MIN_GAP,
+        max_delay: float = RECORDING_MAX_DELAY,
+        controller: Optional[IntanController] = None,
+        scheduler: Optional[ResourceScheduler] = None,
+    ):
+        self._channels = list(channels)
+        self._index = index
+        self._prefix = prefix
+        self._triggers = triggers
+        self._max_duration = max_duration
+        self._max_bytes = max_bytes
+        self._min_gap = min_gap
+        self._max_delay = max_delay
+        self._controller = controller
+        self._scheduler = scheduler or get_scheduler()
+
+        self._tag: Optional[str] = None
+        self._started: Optional[datetime] = None
+        self._started_monotonic = 0.0
+        self._count = 0
+        self._stimulating = 0
+        self._last_stimulation = float("-inf")
+        self._task: Optional[asyncio.Task] = None
+        self.error: Optional[Exception] = None
+
+    @property
+    def tag(self) -> Optional[str]:
+        """Tag of the current file, None if not recording"""
+        return self._tag
+
+    @property
+    def bytes_per_second(self) -> int:
+        return RECORDING_SAMPLE_RATE * (
+            BYTES_PER_SAMPLE * len(self._channels) + TIMESTAMP_BYTES
+        )
+
+    def estimated_bytes(self) -> int:
+        """Estimated size of the current file"""
+        if self._tag is None:
+            return 0
+        elapsed = time.monotonic() - self._started_monotonic
+        return int(elapsed * self.bytes_per_second)
+
+    def _next_tag(self, now: datetime) -> str:
+        self._count += 1
+        return f"{self._prefix}_{now.strftime('%Y%m%dT%H%M%S')}_{self._count:04d}"
+
+    async def _start_file(self):
+        now = datetime.now(timezone.utc)
+        tag = self._next_tag(now)
+        resp = await self._controller._start_raw_recording(
+            self._channels, tag, self._triggers
+        )
+        if not resp.status:
+            raise IntanRecordingError(
+                f"Failed to start recording {tag}: {resp.message}"
+            )
+        self._tag, self._started = tag, now
+        self._started_monotonic = time.monotonic()
+
+    async def _stop_file(self) -> RecordingEntry:
+        resp = await self._controller._stop_raw_recording()
+        entry = RecordingEntry(
+            tag=self._tag,
+            start=self._started,
+            stop=datetime.now(timezone.utc),
+            channels=self._channels,
+        )
+        self._tag = None
+        if not resp.status:
+            raise IntanRecordingError(f"Failed to stop recording {entry.tag}")
+        self._index.add(entry)
+        return entry
+
+    async def start(self):
+        """Start the first file and the rotation in the running loop"""
+        if self._controller is None:
+            self._controller = IntanController()
+        async with self._scheduler.acquire(Resource.Intan):
+            await self._start_file()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> Optional[RecordingEntry]:
+        """Stop the rotation and the current file"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                print(f"Error: recording rotation failed: {str(e)}")
+            self._task = None
+        if self._tag is None:
+            return None
+        async with self._scheduler.acquire(Resource.Intan):
+            return await self._stop_file()
+
+    async def rotate(self) -> RecordingEntry:
+        """Stop the current file and start the next one"""
+        async with self._scheduler.acquire(Resource.Intan, Resource.Trigger):
+            entry = await self._stop_file()
+            await self._start_file()
+        return entry
+
+    def _due(self) -> bool:
+        elapsed = time.monotonic() - self._started_monotonic
+        return (
+            elapsed >= self._max_duration or self.estimated_bytes() >= self._max_bytes
+        )
+
+    def _in_gap(self) -> bool:
+        last = max(self._last_stimulation, last_trigger())
+        return self._stimulating == 0 and time.monotonic() - last >= self._min_gap
+
+    async def _rotate_when_due(self):
+        if self._tag is None:
+            # A failed rotation left no file recording
+            async with self._scheduler.acquire(Resource.Intan):
+                await self._start_file()
+            return
+        if not self._due():
+            return
+        deadline = time.monotonic() + self._max_delay
+        while not self._in_gap() and time.monotonic() < deadline:
+            await asyncio.sleep(self._min_gap / 10)
+        await self.rotate()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(min(self._min_gap, 1.0))
+            try:
+                await self._rotate_when_due()
+                self.error = None
+            except Exception as e:
+                self.error = e
+                print(f"Error: recording rotation failed: {str(e)}")
+
+    @asynccontextmanager
+    async def stimulation(self) -> AsyncIterator[None]:
+        """Mark a stimulation and its response window: no rotation happens inside"""
+        self._stimulating += 1
+        try:
+            yield
+        finally:
+            self._stimulating -= 1
+            self._last_stimulation = time.monotonic()
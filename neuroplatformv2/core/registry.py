@@ -0,0 +1,45 @@
+from typing import Optional
+
+from .database import DatabaseController
+from .intan import IntanController
+
+
+class ControllerRegistry:
+    """Long-lived controllers shared by the tools.
+
+    Controllers are created on first use and reused by every tool call, so the
+    gRPC channel of Intan and the database client stay open across calls.
+    Close the registry with aclose() (or use it with async with) when the
+    agent stops. The HTTP controllers (camera, pumps, Prizmatix) are not kept
+    here: they already share the process-wide HTTP client and are cheap to
+    build on each call.
+    """
+
+    def __init__(self):
+        self._intan: Optional[IntanController] = None
+        self._database: Optional[DatabaseController] = None
+
+    def intan(self) -> IntanController:
+        if self._intan is None:
+            self._intan = IntanController()
+        return self._intan
+
+    def database(self) -> DatabaseController:
+        if self._database is None:
+            self._database = DatabaseController()
+        return self._database
+
+    async def aclose(self):
+        """Close the connections of the controllers created by the registry"""
+        if self._intan is not None:
+            await self._intan._close()
+            self._intan = None
+        if self._database is not None:
+            self._database.close()
+            self._database = None
+
+    async def __aenter__(self) -> "ControllerRegistry":
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
@@ -0,0 +1,59 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List
+
+from ..utils.enumerations import PumpId, Resource
+
+_PUMP_RESOURCES = {
+    PumpId.One: Resource.PumpOne,
+    PumpId.Two: Resource.PumpTwo,
+    PumpId.Three: Resource.PumpThree,
+}
+
+
+def pump_resource(pump: PumpId) -> Resource:
+    return _PUMP_RESOURCES[PumpId(pump)]
+
+
+class ResourceScheduler:
+    """Lock per hardware resource for the tools called concurrently by an agent.
+
+    A tool holds the locks of the resources it changes while it runs: tools on
+    different resources run in parallel, tools on the same resource are queued in
+    arrival order. Several locks are always taken in the order of Resource, so two
+    tools cannot deadlock.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Resource, asyncio.Lock] = {}
+
+    def _lock(self, resource: Resource) -> asyncio.Lock:
+        if resource not in self._locks:
+            self._locks[resource] = asyncio.Lock()
+        return self._locks[resource]
+
+    @asynccontextmanager
+    async def acquire(self, *resources: Resource) -> AsyncIterator[None]:
+        """Hold the locks of the resources"""
+        order = list(Resource)
+        acquired: List[asyncio.Lock] = []
+        try:
+            for resource in sorted(set(resources), key=order.index):
+                lock = self._lock(resource)
+                await lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+    def locked(self, resource: Resource) -> bool:
+        return resource in self._locks and self._locks[resource].locked()
+
+
+_scheduler = ResourceScheduler()
+
+
+def get_scheduler() -> ResourceScheduler:
+    """Scheduler shared by the tools of the process"""
+    return _scheduler
@@ -0,0 +1,238 @@
+from typing import Iterable, List, Optional, Union
+
+import numpy as np
+
+from ..utils.constants import (
+    RECORDING_SAMPLE_RATE,
+    SPIKE_HIGHPASS,
+    SPIKE_NOISE_BLOCK,
+    SPIKE_NOISE_HISTORY,
+)
+from ..utils.schemas import ChannelCoefThreshold
+from .raw import RawRecording, to_microvolts
+
+# std of a gaussian noise = MAD / 0.6745
+MAD_FACTOR = 0.6745
+
+SPIKE_DTYPE = np.dtype(
+    [("sample", np.int64), ("channel", np.int16), ("amplitude", np.float32)]
+)
+
+Coefs = Union[float, np.ndarray, List[ChannelCoefThreshold]]
+
+
+def coef_array(coefs: Coefs, channels: List[int]) -> np.ndarray:
+    """Coefficient per column of the channels (electrode indexes).
+    ChannelCoefThreshold.index is an electrode: electrodes missing from the list
+    keep the default coefficient of the schema, electrodes not in channels are
+    ignored.
+    """
+    if isinstance(coefs, list):
+        by_electrode = {chan.index: chan.coef for chan in coefs}
+        default = ChannelCoefThreshold().coef
+        return np.array(
+            [by_electrode.get(channel, default) for channel in channels],
+            dtype=np.float32,
+        )
+    return np.broadcast_to(np.asarray(coefs, dtype=np.float32), (len(channels),))
+
+
+class HighPassFilter:
+    """Streaming high-pass filter of samples x channels chunks: each sample minus
+    the moving mean of the last sample_rate / cutoff samples. It removes the DC
+    offset and the LFP before the noise estimate and the threshold.
+    """
+
+    def __init__(self, cutoff: float, sample_rate: int, nb_channels: int):
+        self._window = max(int(round(sample_rate / cutoff)), 1)
+        self._tail = np.zeros((0, nb_channels), dtype=np.float64)
+
+    def __call__(self, chunk: np.ndarray) -> np.ndarray:
+        data = np.concatenate([self._tail, chunk.astype(np.float64)])
+        cumsum = np.cumsum(data, axis=0)
+        cumsum = np.concatenate([np.zeros((1, data.shape[1])), cumsum])
+        ends = np.arange(len(self._tail), len(data)) + 1
+        starts = np.maximum(ends - self._window, 0)
+        means = (cumsum[ends] - cumsum[starts]) / (ends - starts)[:, None]
+        self._tail = data[-(self._window - 1) :] if self._window > 1 else data[:0]
+        return (chunk - means).astype(np.float32)
+
+
+def _onsets(below: np.ndarray, carry: np.ndarray) -> np.ndarray:
+    """Samples x channels mask of the first sample of each threshold crossing"""
+    previous = np.concatenate([carry[None], below[:-1]])
+    return below & ~previous
+
+
+class MADSpikeDetector:
+    """Threshold spike detector on samples x channels chunks.
+
+    Same semantics as the Intan ChannelCoefThreshold: a spike is a crossing of
+    -coef x std, with the std estimated per channel by the median absolute
+    deviation. The chunks are high-pass filtered first (cutoff `highpass` Hz),
+    unless highpass is None, for chunks filtered already. The noise estimate is
+    rolling: the median of the MADs of the last `history` blocks of `block`
+    samples, computed for all the channels at once. Chunks must be given in
+    order, as the state carries over between chunks.
+    """
+
+    def __init__(
+        self,
+        coefs: Coefs = 6.0,
+        channels: Optional[List[int]] = None,
+        sample_rate: int = RECORDING_SAMPLE_RATE,
+        highpass: Optional[float] = SPIKE_HIGHPASS,
+        block: int = SPIKE_NOISE_BLOCK,
+        history: int = SPIKE_NOISE_HISTORY,
+    ):
+        self._channels = np.asarray(
+            list(range(128)) if channels is None else channels, dtype=np.int16
+        )
+        nb_channels = len(self._channels)
+        self._coefs = coef_array(coefs, list(self._channels))
+        self._nb_channels = nb_channels
+        self._filter = (
+            HighPassFilter(highpass, sample_rate, nb_channels)
+            if highpass is not None
+            else None
+        )
+        self._block = block
+        self._mads = np.full((history, nb_channels), np.nan, dtype=np.float32)
+        self._next = 0
+        self._sample = 0
+        self._below = np.zeros(nb_channels, dtype=bool)
+        self._sweep_below: Optional[np.ndarray] = None
+
+    @property
+    def noise(self) -> np.ndarray:
+        """Current std estimate per channel"""
+        return np.nanmedian(self._mads, axis=0) / MAD_FACTOR
+
+    def _noise(self) -> np.ndarray:
+        """Std estimate, where no spike is detected on channels without noise"""
+        noise = self.noise
+        return np.where(noise > 0, noise, np.inf).astype(np.float32)
+
+    def _prepare(self, chunk: np.ndarray) -> np.ndarray:
+        chunk = np.asarray(chunk, dtype=np.float32)
+        if chunk.ndim != 2 or chunk.shape[1] != self._nb_channels:
+            raise ValueError(
+                f"Chunk of shape {chunk.shape}, expected (samples, {self._nb_channels})"
+            )
+        return self._filter(chunk) if self._filter is not None else chunk
+
+    def _update_noise(self, chunk: np.ndarray):
+        """MAD of each block of the chunk (the chunk is one block if shorter)"""
+        nb_blocks = max(len(chunk) // self._block, 1)
+        size = len(chunk) // nb_blocks
+        blocks = np.abs(chunk[: nb_blocks * size]).reshape(nb_blocks, size, -1)
+        for mad in np.median(blocks, axis=1)[-len(self._mads) :]:
+            self._mads[self._next % len(self._mads)] = mad
+            self._next += 1
+
+    def detect(self, chunk: np.ndarray) -> np.ndarray:
+        """Spikes of the next chunk, as a SPIKE_DTYPE array sorted by sample.
+        The channel is the electrode index and the amplitude is the trough of the
+        filtered crossing, within the chunk.
+        """
+        chunk = self._prepare(chunk)
+        self._update_noise(chunk)
+        below = chunk < -(self._coefs * self._noise())
+        samples, channels = np.nonzero(_onsets(below, self._below))
+        self._below = below[-1]
+
+        spikes = np.empty(len(samples), dtype=SPIKE_DTYPE)
+        spikes["sample"] = samples + self._sample
+        spikes["channel"] = self._channels[channels]
+        spikes["amplitude"] = _troughs(chunk, below, samples, channels)
+        self._sample += len(chunk)
+        return spikes
+
+    def count(self, chunk: np.ndarray, coefs: np.ndarray) -> np.ndarray:
+        """Number of spikes of the next chunk for several coefficients at once.
+        Use a detector either for detect or for count, not both.
+        :type coefs: np.ndarray
+            Coefficients of the sweep, the same for all the channels
+        :return: coefs x channels counts
+        """
+        chunk = self._prepare(chunk)
+        coefs = np.asarray(coefs, dtype=np.float32)
+        self._update_noise(chunk)
+        # Normalized once, then each coefficient is a comparison
+        z = chunk / self._noise()
+        if self._sweep_below is None or len(self._sweep_below) != len(coefs):
+            self._sweep_below = np.zeros((len(coefs), self._nb_channels), dtype=bool)
+        counts = np.empty((len(coefs), self._nb_channels), dtype=np.int64)
+        for i, coef in enumerate(coefs):
+            below = z < -coef
+            counts[i] = _onsets(below, self._sweep_below[i]).sum(axis=0)
+            self._sweep_below[i] = below[-1]
+        self._sample += len(chunk)
+        return counts
+
+
+def _troughs(
+    chunk: np.ndarray, below: np.ndarray, samples: np.ndarray, channels: np.ndarray
+) -> np.ndarray:
+    """Minimum of each crossing, from its onset to the end of the crossing"""
+    if len(samples) == 0:
+        return np.zeros(0, dtype=np.float32)
+    n = len(chunk)
+    # Channel major, with a sentinel so a crossing can end at the last sample
+    values = np.append(chunk.T.ravel(), 0)
+    above = np.flatnonzero(~below.T.ravel())
+    stops = np.union1d(above, np.arange(1, chunk.shape[1] + 1) * n)
+    starts = channels.astype(np.int64) * n + samples
+    ends = stops[np.searchsorted(stops, starts)]
+    return np.minimum.reduceat(values, np.stack([starts, ends], axis=1).ravel())[::2]
+
+
+# MARK: Recordings
+
+
+def _chunks(
+    recording: RawRecording, start: int, stop: Optional[int], chunk: float
+) -> Iterable[np.ndarray]:
+    stop = len(recording) if stop is None else min(stop, len(recording))
+    size = int(chunk * recording.sample_rate)
+    for offset in range(start, stop, size):
+        yield to_microvolts(recording[offset : min(offset + size, stop)])
+
+
+def detect_recording(
+    recording: RawRecording,
+    coefs: Coefs = 6.0,
+    start: int = 0,
+    stop: Optional[int] = None,
+    chunk: float = 1.0,
+) -> np.ndarray:
+    """Spikes of the samples [start, stop) of a recording, read chunk by chunk.
+    Samples of the spikes are positions in the recording, channels are electrodes
+    and amplitudes are in uV of the high-pass filtered signal.
+    :type chunk: float
+        Duration of the chunks in seconds
+    """
+    detector = MADSpikeDetector(coefs, recording.channels, recording.sample_rate)
+    spikes = [detector.detect(data) for data in _chunks(recording, start, stop, chunk)]
+    spikes = np.concatenate(spikes) if spikes else np.zeros(0, dtype=SPIKE_DTYPE)
+    spikes["sample"] += start
+    return spikes
+
+
+def sweep_recording(
+    recording: RawRecording,
+    coefs: np.ndarray,
+    start: int = 0,
+    stop: Optional[int] = None,
+    chunk: float = 1.0,
+) -> np.ndarray:
+    """Spike counts of a recording for several coefficients, in one pass.
+    :return: coefs x channels counts, columns in the order of recording.channels
+    """
+    detector = MADSpikeDetector(
+        channels=recording.channels, sample_rate=recording.sample_rate
+    )
+    counts = np.zeros((len(coefs), len(recording.channels)), dtype=np.int64)
+    for data in _chunks(recording, start, stop, chunk):
+        counts += detector.count(data, coefs)
+    return counts
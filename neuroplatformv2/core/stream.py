@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Callable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..utils.constants import STREAM_CHUNK_ROWS, STREAM_CHUNK_SECONDS
+
+# Bounds of the chunk duration adaptation between two chunks
+MIN_CHUNK = timedelta(milliseconds=100)
+MAX_GROWTH = 4.0
+
+
+def _next_chunk(chunk: timedelta, rows: int, target_rows: int) -> timedelta:
+    """Scale the chunk duration so the next chunk has about target_rows rows"""
+    factor = target_rows / max(rows, 1)
+    factor = min(max(factor, 1 / MAX_GROWTH), MAX_GROWTH)
+    return max(chunk * factor, MIN_CHUNK)
+
+
+async def stream_query(
+    start: datetime,
+    stop: datetime,
+    query: Callable[[datetime, datetime], pd.DataFrame],
+    chunk: Optional[timedelta] = None,
+    max_rows: int = STREAM_CHUNK_ROWS,
+) -> AsyncIterator[pd.DataFrame]:
+    """Run a query over [start, stop) by time chunks and yield frames of at most max_rows rows.
+    The chunk duration adapts to the row rate, and the next chunk is fetched while
+    the current one is consumed.
+    :type query: Callable
+        Blocking query(start, stop) of the database, run in a thread
+    :type chunk: timedelta, optional
+        Duration of the first chunk
+    """
+    chunk = chunk or timedelta(seconds=STREAM_CHUNK_SECONDS)
+    chunk_stop = min(start + chunk, stop)
+    pending = asyncio.ensure_future(asyncio.to_thread(query, start, chunk_stop))
+    try:
+        while pending is not None:
+            chunk_start = chunk_stop
+            df = await pending
+            pending = None
+
+            if chunk_start < stop:
+                chunk = _next_chunk(chunk, len(df.index), max_rows)
+                chunk_stop = min(chunk_start + chunk, stop)
+                pending = asyncio.ensure_future(
+                    asyncio.to_thread(query, chunk_start, chunk_stop)
+                )
+
+            for i in range(0, len(df.index), max_rows):
+                yield df.iloc[i : i + max_rows]
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+# MARK: Reducers consuming a stream in constant memory
+
+
+async def reduce_counts(
+    stream: AsyncIterator[pd.DataFrame],
+    nb_channels: int = 128,
+    column: str = "channel",
+) -> np.ndarray:
+    """Number of rows per channel (or per value of another integer column)"""
+    counts = np.zeros(nb_channels, dtype=np.int64)
+    async for df in stream:
+        if len(df.index) > 0:
+            counts += np.bincount(
+                df[column].to_numpy(dtype=np.int64), minlength=nb_channels
+            )[:nb_channels]
+    return counts
+
+
+async def reduce_rates(
+    stream: AsyncIterator[pd.DataFrame],
+    start: datetime,
+    stop: datetime,
+    nb_channels: int = 128,
+) -> np.ndarray:
+    """Rows per second per channel over [start, stop)"""
+    counts = await reduce_counts(stream, nb_channels)
+    return counts / (stop - start).total_seconds()
+
+
+async def reduce_histogram(
+    stream: AsyncIterator[pd.DataFrame], column: str, bins: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Histogram of a column over fixed bin edges"""
+    bins = np.asarray(bins)
+    hist = np.zeros(len(bins) - 1, dtype=np.int64)
+    async for df in stream:
+        if len(df.index) > 0:
+            hist += np.histogram(df[column].to_numpy(), bins=bins)[0]
+    return hist, bins
@@ -0,0 +1,253 @@
+import asyncio
+from datetime import datetime
+from typing import AsyncIterator, Callable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..utils.enumerations import AggregateFn, SummaryMode
+from ..utils.schemas import DataPage, SummaryOptions
+from .archive import as_utc
+from .stream import reduce_counts, stream_query
+
+
+# Blocking aggregate(start, stop, every, fn) of the database: dense matrix indexed
+# by window time (labelled by the window stop), with one column per key
+Aggregator = Callable[[datetime, datetime, str, AggregateFn], pd.DataFrame]
+
+
+def encode_cursor(time: pd.Timestamp, skip: int) -> str:
+    """Cursor of a page: time of its first row and rows already returned at that time"""
+    return f"{pd.Timestamp(time).isoformat()}/{skip}"
+
+
+def decode_cursor(cursor: str) -> Tuple[pd.Timestamp, int]:
+    """Time (with its nanoseconds) and skip of a cursor"""
+    time, skip = cursor.rsplit("/", 1)
+    return pd.Timestamp(time), int(skip)
+
+
+def _flux_duration(every: str) -> str:
+    return every.replace("min", "m")
+
+
+def _sorted_query(
+    query: Callable[[datetime, datetime], pd.DataFrame],
+    time_column: str,
+    key_column: str,
+) -> Callable[[datetime, datetime], pd.DataFrame]:
+    """Query returning the rows in a stable (time, key) order, for reproducible pages"""
+
+    def sorted_query(start: datetime, stop: datetime) -> pd.DataFrame:
+        df = query(start, stop)
+        if len(df.index) == 0:
+            return df
+        return df.sort_values(
+            by=[time_column, key_column], kind="stable", ignore_index=True
+        )
+
+    return sorted_query
+
+
+async def _page_rows(
+    stream: AsyncIterator[pd.DataFrame],
+    start: datetime,
+    max_rows: int,
+    skip: int,
+    time_column: str,
+) -> DataPage:
+    """First max_rows rows of a time sorted stream from start, after skip rows"""
+    parts, rows, skipped = [], 0, skip
+    # The query range has microseconds: drop the rows before a nanosecond start
+    first = pd.Timestamp(as_utc(start))
+    async for df in stream:
+        if len(df.index) > 0:
+            df = df[pd.to_datetime(df[time_column], utc=True) >= first]
+        if skip > 0:
+            df, skip = df.iloc[skip:], max(skip - len(df.index), 0)
+        parts.append(df.iloc[: max_rows + 1 - rows])
+        rows += len(parts[-1].index)
+        if rows > max_rows:
+            break
+    parts = [df for df in parts if len(df.index) > 0]
+    if not parts:
+        return DataPage(data=pd.DataFrame())
+    page = pd.concat(parts, ignore_index=True)
+    if len(page.index) <= max_rows:
+        return DataPage(data=page)
+
+    # The row after the page starts the next one
+    page, next_time = page.iloc[:max_rows], page[time_column].iloc[max_rows]
+    times = page[time_column]
+    at_next = int((times == next_time).sum())
+    if pd.Timestamp(next_time) == pd.Timestamp(start):
+        # Rows at the start time were also skipped before the page
+        at_next += skipped
+    return DataPage(data=page, cursor=encode_cursor(next_time, at_next))
+
+
+async def _downsample(
+    stream: AsyncIterator[pd.DataFrame],
+    every: str,
+    max_rows: int,
+    time_column: str,
+    key_column: str,
+    value_column: str,
+) -> DataPage:
+    """Number of rows and mean value per window and key, by pages of whole windows.
+    The stream is read only up to the windows of the page.
+    """
+    every = pd.Timedelta(every)
+    parts = []
+    async for df in stream:
+        if len(df.index) == 0:
+            continue
+        window = pd.to_datetime(df[time_column], utc=True).dt.floor(every)
+        parts.append(
+            df.groupby([window.rename("Time"), df[key_column]])[value_column].agg(
+                ["count", "sum"]
+            )
+        )
+        # Windows before the last one seen are complete
+        last = window.max()
+        done = sum(int((part.index.get_level_values(0) < last).sum()) for part in parts)
+        if done > max_rows:
+            break
+    if not parts:
+        return DataPage(data=pd.DataFrame())
+
+    agg = pd.concat(parts).groupby(level=[0, 1]).sum().sort_index()
+    agg["mean"] = agg["sum"] / agg["count"]
+    agg = agg.drop(columns="sum").reset_index()
+
+    # Whole windows, at least one, up to max_rows rows
+    sizes = agg.groupby("Time", sort=True).size()
+    ends = np.cumsum(sizes.to_numpy())
+    keep = max(int(np.searchsorted(ends, max_rows, side="right")), 1)
+    if keep == len(sizes.index):
+        return DataPage(data=agg)
+    page = agg.iloc[: ends[keep - 1]]
+    return DataPage(data=page, cursor=encode_cursor(sizes.index[keep], 0))
+
+
+async def _aggregate_counts(
+    aggregate: Aggregator, start: datetime, stop: datetime
+) -> pd.Series:
+    """Number of rows per key over [start, stop), counted by the database"""
+    seconds = int(np.ceil((as_utc(stop) - as_utc(start)).total_seconds()))
+    # The windows are aligned on the epoch: the range spans at most two of them
+    matrix = await asyncio.to_thread(
+        aggregate, start, stop, f"{max(seconds, 1)}s", AggregateFn.Count
+    )
+    return matrix.fillna(0).sum(axis=0).astype(np.int64)
+
+
+async def _downsample_aggregate(
+    aggregate: Aggregator,
+    start: datetime,
+    stop: datetime,
+    every: str,
+    max_rows: int,
+    key_column: str,
+) -> DataPage:
+    """Number of rows and mean value per window and key, by pages of whole windows,
+    aggregated by the database. A page queries at most max_rows windows.
+    """
+    step = pd.Timedelta(every)
+    start = pd.Timestamp(as_utc(start)).floor(step)
+    end = min(pd.Timestamp(as_utc(stop)), start + step * max_rows)
+    counts, means = await asyncio.gather(
+        asyncio.to_thread(
+            aggregate, start, end, _flux_duration(every), AggregateFn.Count
+        ),
+        asyncio.to_thread(
+            aggregate, start, end, _flux_duration(every), AggregateFn.Mean
+        ),
+    )
+    cursor = encode_cursor(end, 0) if end < pd.Timestamp(as_utc(stop)) else None
+    if len(counts.index) == 0:
+        return DataPage(data=pd.DataFrame(), cursor=cursor)
+
+    def _long(matrix: pd.DataFrame, name: str) -> pd.DataFrame:
+        matrix = matrix.rename_axis(index="Time", columns=key_column)
+        return matrix.reset_index().melt(id_vars="Time", value_name=name)
+
+    agg = _long(counts, "count").merge(
+        _long(means.reindex_like(counts), "mean"), on=["Time", key_column]
+    )
+    agg = agg[agg["count"].fillna(0) > 0].astype({"count": np.int64})
+    # Windows are labelled by their stop, the page by their start
+    times = pd.to_datetime(agg["Time"], utc=True)
+    agg["Time"] = (times - pd.Timedelta(1, "ns")).dt.floor(step)
+    agg = agg.sort_values(by=["Time", key_column], ignore_index=True)
+
+    sizes = agg.groupby("Time", sort=True).size()
+    ends = np.cumsum(sizes.to_numpy())
+    keep = max(int(np.searchsorted(ends, max_rows, side="right")), 1)
+    if keep == len(sizes.index):
+        return DataPage(data=agg, cursor=cursor)
+    page = agg.iloc[: ends[keep - 1]]
+    return DataPage(data=page, cursor=encode_cursor(sizes.index[keep], 0))
+
+
+async def summarize(
+    query: Callable[[datetime, datetime], pd.DataFrame],
+    start: datetime,
+    stop: datetime,
+    options: SummaryOptions,
+    value_column: str,
+    time_column: str = "Time",
+    key_column: str = "channel",
+    aggregate: Optional[Aggregator] = None,
+) -> DataPage:
+    """Bounded result of a query over [start, stop).
+    The counts, rates, top_k and downsampled modes are reduced by the database
+    with aggregate, or from the streamed rows without it.
+    :type query: Callable
+        Blocking query(start, stop) of the database
+    :type options: SummaryOptions
+        Mode, row cap and cursor of the previous page
+    :type aggregate: Aggregator, optional
+        Blocking aggregate(start, stop, every, fn) of the database
+    """
+    if options.mode in (SummaryMode.Counts, SummaryMode.Rates, SummaryMode.TopK):
+        if aggregate is not None:
+            counts = await _aggregate_counts(aggregate, start, stop)
+            counts = counts[counts > 0].sort_index()
+            df = pd.DataFrame(
+                {key_column: counts.index.astype(int), "count": counts.to_numpy()}
+            )
+        else:
+            counts = await reduce_counts(
+                stream_query(start, stop, query), column=key_column
+            )
+            keys = np.flatnonzero(counts)
+            df = pd.DataFrame({key_column: keys, "count": counts[keys]})
+        if options.mode == SummaryMode.Rates:
+            df["rate"] = df["count"] / (as_utc(stop) - as_utc(start)).total_seconds()
+        if options.mode == SummaryMode.TopK:
+            df = df.sort_values(by="count", ascending=False, kind="stable").head(
+                options.k
+            )
+        return DataPage(data=df.head(options.max_rows).reset_index(drop=True))
+
+    skip = 0
+    if options.cursor is not None:
+        start, skip = decode_cursor(options.cursor)
+
+    if options.mode == SummaryMode.Downsampled:
+        if aggregate is not None:
+            return await _downsample_aggregate(
+                aggregate, start, stop, options.every, options.max_rows, key_column
+            )
+        return await _downsample(
+            stream_query(start, stop, query),
+            options.every,
+            options.max_rows,
+            time_column,
+            key_column,
+            value_column,
+        )
+
+    stream = stream_query(start, stop, _sorted_query(query, time_column, key_column))
+    return await _page_rows(stream, start, options.max_rows, skip, time_column)
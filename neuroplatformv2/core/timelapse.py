@@ -0,0 +1,193 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from ..utils.schemas import TimelapseRequest
+from .camera import CameraController, _decoder
+
+# JPEG decoding at 1/scale of the resolution, without decoding the full image
+REDUCED_FLAGS = {
+    (1, False): cv2.IMREAD_COLOR,
+    (2, False): cv2.IMREAD_REDUCED_COLOR_2,
+    (4, False): cv2.IMREAD_REDUCED_COLOR_4,
+    (8, False): cv2.IMREAD_REDUCED_COLOR_8,
+    (1, True): cv2.IMREAD_GRAYSCALE,
+    (2, True): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (4, True): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (8, True): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+class TimelapseStore:
+    """Chunked, compressed store of timelapse frames.
+    Frames are written by chunks of `chunk_size` in `chunk_XXXXX.npz` files, with
+    the ids, dates, frame shape and decoding parameters in `meta.json`. Reading
+    loads one chunk at a time. Reopening a store appends after its last frame,
+    filling its last chunk first.
+    """
+
+    def __init__(
+        self, path: str, chunk_size: int = 32, params: Optional[dict] = None
+    ):
+        self._path = path
+        self._chunk_size = chunk_size
+        self._buffer: List[np.ndarray] = []
+        self._chunk: Tuple[int, Optional[np.ndarray]] = (-1, None)
+        self._written = 0
+        self.ids: List[str] = []
+        self.dates: List[str] = []
+        self.shape: Optional[Tuple[int, ...]] = None
+        self.params = params
+
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if params is not None and meta.get("params") != params:
+                raise ValueError(
+                    f"Store {path} was built with {meta.get('params')}, not {params}"
+                )
+            self._chunk_size = meta["chunk_size"]
+            self.ids = meta["ids"]
+            self.dates = meta["dates"]
+            self.shape = tuple(meta["shape"]) if meta["shape"] else None
+            self.params = meta.get("params")
+            self._written = len(self.ids)
+        else:
+            os.makedirs(path, exist_ok=True)
+
+    def _chunk_path(self, index: int) -> str:
+        return os.path.join(self._path, f"chunk_{index:05d}.npz")
+
+    def append(self, frame: np.ndarray, img_id: str, date: datetime):
+        """Add a frame. Frames are written when a chunk is full."""
+        if self.shape is None:
+            self.shape = frame.shape
+        elif frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} differs from {self.shape}")
+        self._buffer.append(frame)
+        self.ids.append(img_id)
+        self.dates.append(pd.Timestamp(date).isoformat())
+        if len(self.ids) % self._chunk_size == 0:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered frames and the metadata.
+        A partial last chunk is rewritten with the new frames.
+        """
+        while self._buffer:
+            index, filled = divmod(self._written, self._chunk_size)
+            frames = self._buffer[: self._chunk_size - filled]
+            chunk = np.stack(frames)
+            if filled:
+                chunk = np.concatenate([self.chunk(index)[:filled], chunk])
+            np.savez_compressed(self._chunk_path(index), frames=chunk)
+            self._chunk = (-1, None)
+            self._written += len(frames)
+            self._buffer = self._buffer[len(frames) :]
+        meta_path = os.path.join(self._path, "meta.json")
+        tmp = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "chunk_size": self._chunk_size,
+                    "shape": list(self.shape) if self.shape else None,
+                    "params": self.params,
+                    "ids": self.ids,
+                    "dates": self.dates,
+                },
+                f,
+            )
+        os.replace(tmp, meta_path)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def chunk(self, index: int) -> np.ndarray:
+        """Frames of a chunk"""
+        if self._chunk[0] != index:
+            with np.load(self._chunk_path(index)) as data:
+                self._chunk = (index, data["frames"])
+        return self._chunk[1]
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        if i >= self._written:
+            return self._buffer[i - self._written]
+        return self.chunk(i // self._chunk_size)[i % self._chunk_size]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for index in range((self._written + self._chunk_size - 1) // self._chunk_size):
+            yield from self.chunk(index)
+        yield from self._buffer
+
+
+class TimelapseBuilder:
+    """Build a timelapse of a MEA from the camera images.
+    JPEGs are decoded at reduced resolution, optionally in grayscale and cropped to
+    a region of interest, and streamed into a TimelapseStore chunk by chunk, so the
+    memory depends on the output size, not on the camera resolution.
+    """
+
+    def __init__(
+        self, req: TimelapseRequest, camera: Optional[CameraController] = None
+    ):
+        self._req = req
+        self._camera = camera or CameraController(req.mea)
+        self._flag = REDUCED_FLAGS[(req.scale, req.grayscale)]
+
+    def _decode(self, content: bytes) -> np.ndarray:
+        img = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), flags=self._flag)
+        if self._req.roi is not None:
+            # ROI is given in full resolution pixels
+            x, y, w, h = (v // self._req.scale for v in self._req.roi)
+            img = img[y : y + h, x : x + w]
+        if not self._req.grayscale:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        return np.ascontiguousarray(img)
+
+    async def build(self) -> TimelapseStore:
+        """List the images of the interval and write the timelapse to req.path.
+        An existing store of the same parameters is extended with the images after
+        its last frame.
+        """
+        req = self._req
+        images = await self._camera._list_images(req.start_date, req.end_date)
+        images = images.sort_values(by="date", ignore_index=True)
+        params = req.model_dump(
+            mode="json", include={"mea", "scale", "grayscale", "roi"}
+        )
+        store = TimelapseStore(req.path, req.chunk_size, params)
+        if store.dates:
+            last = pd.to_datetime(store.dates[-1], utc=True)
+            images = images[pd.to_datetime(images["date"], utc=True) > last]
+            images = images[~images["id"].isin(store.ids)].reset_index(drop=True)
+        loop = asyncio.get_running_loop()
+
+        for i in range(0, len(images.index), req.chunk_size):
+            batch = images.iloc[i : i + req.chunk_size]
+            contents = await asyncio.gather(
+                *[self._camera._fetch_jpeg(img_id) for img_id in batch["id"]]
+            )
+            frames = await asyncio.gather(
+                *[
+                    loop.run_in_executor(_decoder, self._decode, content)
+                    for content in contents
+                ]
+            )
+            for frame, img_id, date in zip(frames, batch["id"], batch["date"]):
+                store.append(frame, img_id, date)
+
+        store.flush()
+        return store
+
+
+async def build_timelapse(req: TimelapseRequest) -> TimelapseStore:
+    validator = TimelapseRequest(**req.model_dump())
+    return await TimelapseBuilder(validator).build()
@@ -1,4 +1,5 @@
 import socket
+import time
 import psycopg2
 import pandas as pd
 from datetime import datetime, timezone
@@ -11,6 +12,20 @@ from ..utils.exceptions import (
 )
 from ..utils.schemas import TriggerPattern
 
+# Monotonic time of the last trigger sent by the process (electrical or UV)
+_last_trigger = float("-inf")
+
+
+def mark_trigger():
+    """Record that a trigger was sent now"""
+    global _last_trigger
+    _last_trigger = time.monotonic()
+
+
+def last_trigger() -> float:
+    """Monotonic time of the last trigger sent by the process"""
+    return _last_trigger
+
 
 class TriggerController:
     def __init__(self, email: str, timeout=5):
@@ -107,6 +122,7 @@ class TriggerController:
         try:
             if self.__check_time__():
                 self.sock.send(pattern.tobytes())
+                mark_trigger()
             else:
                 raise TriggerConnectionError(
                     f"Booking time: ({self.start_time}-{self.end_time})"
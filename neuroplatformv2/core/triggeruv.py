@@ -1,14 +1,24 @@
+import asyncio
 import socket
+import time
+from typing import List, Optional, Tuple
 
 import numpy as np
 
 from ..utils.constants import (
     TRIGGER_IP,
     TRIGGER_UV_PORT,
+    TRIGGER_UV_SPIN,
     TRIGGER_UV_TIMEOUT,
 )
+from ..utils.enumerations import Resource
 from ..utils.exceptions import TriggerUVConnectionError, TriggerUVSendError
-from ..utils.schemas import TriggerUVSendRequest
+from ..utils.schemas import TriggerUVSendRequest, TriggerUVTrainRequest
+from .scheduler import ResourceScheduler, get_scheduler
+from .trigger import mark_trigger
+
+# One pulse sent by a TriggerUVSession: monotonic and wall clock send times, value t
+PULSE_DTYPE = np.dtype([("monotonic", "f8"), ("time", "f8"), ("t", "i4")])
 
 
 class TriggerUVController:
@@ -40,6 +50,7 @@ class TriggerUVController:
             raise TriggerUVSendError("Value must be bigger than 0")
         self.buffer[0] = t
         self.sock.send(self.buffer.tobytes())
+        mark_trigger()
 
     @classmethod
     async def trigger_uv_send(cls, req: TriggerUVSendRequest) -> str:
@@ -51,6 +62,121 @@ class TriggerUVController:
             controller._close()
 
 
+class TriggerUVSession:
+    """Persistent async connection to the trigger UV, for pulse trains.
+
+    Pulses are scheduled against the monotonic clock: the session sleeps until
+    TRIGGER_UV_SPIN seconds before a pulse, then spins until its exact time, so the
+    jitter does not depend on the event loop wake-up. Every pulse sent is logged
+    with its monotonic and wall clock time for the alignment with the recordings.
+    A pulse train holds the TriggerUV lock of the scheduler until its last pulse.
+    """
+
+    def __init__(
+        self,
+        spin: float = TRIGGER_UV_SPIN,
+        scheduler: Optional[ResourceScheduler] = None,
+    ):
+        self._spin = spin
+        self._scheduler = scheduler or get_scheduler()
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._log: List[Tuple[float, float, int]] = []
+        # Offset between the wall clock and the monotonic clock
+        self._offset = time.time() - time.monotonic()
+
+    async def open(self):
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(TRIGGER_IP, TRIGGER_UV_PORT),
+                TRIGGER_UV_TIMEOUT,
+            )
+        except asyncio.TimeoutError as e:
+            raise TriggerUVConnectionError(f"Connection attempt timed out: {str(e)}")
+        except OSError as e:
+            raise TriggerUVConnectionError(f"Failed to connect to trigger UV: {str(e)}")
+        sock = self._writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    async def close(self):
+        """Close the connection"""
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._reader, self._writer = None, None
+
+    async def __aenter__(self) -> "TriggerUVSession":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _write(self, t: int) -> float:
+        """Write a pulse and log it, returns the monotonic send time"""
+        if t < 1:
+            raise TriggerUVSendError("Value must be bigger than 0")
+        if self._writer is None:
+            raise TriggerUVSendError("Session is not open")
+        sent = time.monotonic()
+        self._writer.write(np.int32(t).tobytes())
+        self._log.append((sent, sent + self._offset, t))
+        mark_trigger()
+        return sent
+
+    async def send(self, t: int) -> float:
+        """Activate the UV for a period of t now
+        :type t: int
+        """
+        sent = self._write(t)
+        await self._writer.drain()
+        return sent
+
+    async def _wait_until(self, deadline: float):
+        """Sleep, then spin the last TRIGGER_UV_SPIN seconds up to the deadline"""
+        remaining = deadline - time.monotonic()
+        if remaining > self._spin:
+            await asyncio.sleep(remaining - self._spin)
+        while time.monotonic() < deadline:
+            pass
+
+    async def pulse_train(
+        self, t: int, period: float, count: int, start: Optional[float] = None
+    ) -> np.ndarray:
+        """Send count pulses of t, one every period seconds
+        :type start: float, optional
+            Monotonic time of the first pulse, now by default
+        Returns:
+            np.ndarray: PULSE_DTYPE log of the train
+        """
+        first = len(self._log)
+        async with self._scheduler.acquire(Resource.TriggerUV):
+            start = time.monotonic() if start is None else start
+            for i in range(count):
+                await self._wait_until(start + i * period)
+                self._write(t)
+                await self._writer.drain()
+        return self.timestamps()[first:]
+
+    def timestamps(self) -> np.ndarray:
+        """PULSE_DTYPE log of all the pulses sent by the session"""
+        return np.array(self._log, dtype=PULSE_DTYPE)
+
+    @classmethod
+    async def trigger_uv_train(cls, req: TriggerUVTrainRequest) -> np.ndarray:
+        async with cls() as session:
+            return await session.pulse_train(req.t, req.period, req.count)
+
+
 async def trigger_uv_send(req: TriggerUVSendRequest) -> str:
-    validator = TriggerUVSendRequest(t=req)
-    return await validator.trigger_uv_send(req)
+    validator = TriggerUVSendRequest(t=req.t)
+    return await TriggerUVController.trigger_uv_send(validator)
+
+
+async def trigger_uv_train(req: TriggerUVTrainRequest) -> np.ndarray:
+    validator = TriggerUVTrainRequest(t=req.t, period=req.period, count=req.count)
+    return await TriggerUVSession.trigger_uv_train(validator)
@@ -8,6 +8,8 @@ from langchain_core.tools import ToolException
 from pydantic import BaseModel
 
 from ..core.camera import CameraController
+from ..core.scheduler import get_scheduler
+from ..utils.enumerations import Resource
 from ..utils.schemas import (
     CameraCaptureRequest,
     CameraFromRequest,
@@ -138,8 +140,9 @@ class CameraCaptureTool(BaseTool):
         Use the tool to capture MEA.
         """
         try:
-            camera_controller = CameraController(req.mea)
-            return await camera_controller.capture(req)
+            async with get_scheduler().acquire(Resource.Camera):
+                camera_controller = CameraController(req.mea)
+                return await camera_controller.capture(req)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
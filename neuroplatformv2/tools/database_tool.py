@@ -1,41 +1,48 @@
 from typing import Optional, Type
 
-import pandas as pd
 from langchain.tools import BaseTool
 from langchain_core.callbacks.manager import AsyncCallbackManagerForToolRun
 from langchain_core.tools import ToolException
 from pydantic import BaseModel
 
 from ..core.database import DatabaseController
+from ..core.registry import ControllerRegistry
 from ..utils.schemas import (
-    RawSpikeQuery,
-    SpikeCountQuery,
-    SpikeEventQuery,
-    TriggersQuery,
+    DataPage,
+    RawSpikeSummaryQuery,
+    SpikeCountSummaryQuery,
+    SpikeEventSummaryQuery,
+    TriggersSummaryQuery,
 )
 
 
+def _database(registry: Optional[ControllerRegistry]) -> Optional[DatabaseController]:
+    """Long-lived controller of the registry, None to use a new client"""
+    return registry.database() if registry is not None else None
+
+
 class ExperimentGetSpikeEventTool(BaseTool):
     name = "get_spike_event"
-    description = "Get spike event from db."
-    args_schema: Type[BaseModel] = SpikeEventQuery
+    description = "Get spike event from db, by pages of rows or summarized per channel."
+    args_schema: Type[BaseModel] = SpikeEventSummaryQuery
     handle_tool_error = True
     handle_validation_error = True
+    registry: Optional[ControllerRegistry] = None
 
     def _run(self):
         return ""  # ! We need to implement this method to run the tool otherwise we're getting an error
 
     async def _arun(
         self,
-        req: Type[BaseModel] = SpikeEventQuery,
+        req: Type[BaseModel] = SpikeEventSummaryQuery,
         run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
-    ) -> Optional[pd.DataFrame]:
+    ) -> DataPage:
         """
         Use the tool to get spike event from db.
         """
         try:
-            db_controller = DatabaseController()
-            return await db_controller.get_spike_event(req)
+            controller = _database(self.registry)
+            return await DatabaseController.summarize_spike_event(req, controller)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -43,25 +50,26 @@ class ExperimentGetSpikeEventTool(BaseTool):
 
 class ExperimentGetRawSpikeTool(BaseTool):
     name = "get_raw_spike"
-    description = "Get raw spike from db."
-    args_schema: Type[BaseModel] = RawSpikeQuery
+    description = "Get raw spike from db, by pages of rows or summarized per channel."
+    args_schema: Type[BaseModel] = RawSpikeSummaryQuery
     handle_tool_error = True
     handle_validation_error = True
+    registry: Optional[ControllerRegistry] = None
 
     def _run(self):
         return ""  # ! We need to implement this method to run the tool otherwise we're getting an error
 
     async def _arun(
         self,
-        req: Type[BaseModel] = RawSpikeQuery,
+        req: Type[BaseModel] = RawSpikeSummaryQuery,
         run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
-    ) -> pd.DataFrame:
+    ) -> DataPage:
         """
         Use the tool to get raw spike from db.
         """
         try:
-            db_controller = DatabaseController()
-            return await db_controller.get_raw_spike(req)
+            controller = _database(self.registry)
+            return await DatabaseController.summarize_raw_spike(req, controller)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -69,25 +77,26 @@ class ExperimentGetRawSpikeTool(BaseTool):
 
 class ExperimentGetSpikeCountTool(BaseTool):
     name = "get_spike_count"
-    description = "Get spike count from db."
-    args_schema: Type[BaseModel] = SpikeCountQuery
+    description = "Get spike count from db, by pages of rows or summarized per channel."
+    args_schema: Type[BaseModel] = SpikeCountSummaryQuery
     handle_tool_error = True
     handle_validation_error = True
+    registry: Optional[ControllerRegistry] = None
 
     def _run(self):
         return ""  # ! We need to implement this method to run the tool otherwise we're getting an error
 
     async def _arun(
         self,
-        req: Type[BaseModel] = SpikeCountQuery,
+        req: Type[BaseModel] = SpikeCountSummaryQuery,
         run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
-    ) -> pd.DataFrame:
+    ) -> DataPage:
         """
         Use the tool to Get spike count from db.
         """
         try:
-            db_controller = DatabaseController()
-            return await db_controller.get_spike_count(req)
+            controller = _database(self.registry)
+            return await DatabaseController.summarize_spike_count(req, controller)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -95,25 +104,28 @@ class ExperimentGetSpikeCountTool(BaseTool):
 
 class ExperimentGetAllTriggersTool(BaseTool):
     name = "get_all_triggers"
-    description = "Get all triggers from db."
-    args_schema: Type[BaseModel] = TriggersQuery
+    description = (
+        "Get all triggers from db, by pages of rows or summarized per trigger."
+    )
+    args_schema: Type[BaseModel] = TriggersSummaryQuery
     handle_tool_error = True
     handle_validation_error = True
+    registry: Optional[ControllerRegistry] = None
 
     def _run(self):
         return ""  # ! We need to implement this method to run the tool otherwise we're getting an error
 
     async def _arun(
         self,
-        req: Type[BaseModel] = TriggersQuery,
+        req: Type[BaseModel] = TriggersSummaryQuery,
         run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
-    ) -> pd.DataFrame:
+    ) -> DataPage:
         """
         Use the tool to get all triggers from db.
         """
         try:
-            db_controller = DatabaseController()
-            return await db_controller.get_all_triggers(req)
+            controller = _database(self.registry)
+            return await DatabaseController.summarize_all_triggers(req, controller)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
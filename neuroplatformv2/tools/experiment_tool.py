@@ -32,8 +32,7 @@ class ExperimentStarterTool(BaseTool):
         Use the tool to start the experiment.
         """
         try:
-            experiment_controller = ExperimentController(req.token)
-            return await experiment_controller.start(req)
+            return await ExperimentController.start(req)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -58,8 +57,7 @@ class ExperimentStopperTool(BaseTool):
         Use the tool to stop the experiment.
         """
         try:
-            experiment_controller = ExperimentController(req.token)
-            return await experiment_controller.stop(req)
+            return await ExperimentController.stop(req)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -84,8 +82,7 @@ class ExperimentBestStimParamTool(BaseTool):
         Use the tool to get the best stimparam for an electrode.
         """
         try:
-            experiment_controller = ExperimentController(req.token)
-            return await experiment_controller.best_stim_param(req)
+            return await ExperimentController.best_stim_param(req)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
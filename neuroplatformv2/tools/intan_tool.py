@@ -8,6 +8,9 @@ from langchain_core.tools import ToolException
 from pydantic import BaseModel
 
 from ..core.intan import IntanController
+from ..core.registry import ControllerRegistry
+from ..core.scheduler import get_scheduler
+from ..utils.enumerations import Resource
 from ..utils.schemas import (
     CountListenerRequest,
     ReadCountResponse,
@@ -18,12 +21,18 @@ from ..utils.schemas import (
 )
 
 
+def _intan(registry: Optional[ControllerRegistry]) -> Optional[IntanController]:
+    """Long-lived controller of the registry, None to use a new connection"""
+    return registry.intan() if registry is not None else None
+
+
 class IntanVarThresholdTool(BaseTool):
     name = "var_threshold"
     description = "Enable/disable auto variation threshold."
     args_schema: Type[BaseModel] = VarThresholdRequest
     handle_tool_error = True
     handle_validation_error = True
+    registry: Optional[ControllerRegistry] = None
 
     def _run(self):
         return ""  # ! We need to implement this method to run the tool otherwise we're getting an error
@@ -37,8 +46,9 @@ class IntanVarThresholdTool(BaseTool):
         Use the tool to enable/disable auto variation threshold.
         """
         try:
-            intan_controller = IntanController()
-            return await intan_controller.var_threshold(req)
+            async with get_scheduler().acquire(Resource.Intan):
+                controller = _intan(self.registry)
+                return await IntanController.var_threshold(req, controller)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -62,8 +72,9 @@ class IntanImpedanceTool(BaseTool):
         Use the tool to run impedance measurement.
         """
         try:
-            intan_controller = IntanController()
-            return await intan_controller.impedance()
+            async with get_scheduler().acquire(Resource.Intan):
+                intan_controller = IntanController()
+                return await intan_controller.impedance()
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -88,8 +99,9 @@ class IntanSetCountTool(BaseTool):
         Use the tool to set count listener on selected triggers.
         """
         try:
-            intan_controller = IntanController()
-            return await intan_controller.set_count(req)
+            async with get_scheduler().acquire(Resource.Intan):
+                intan_controller = IntanController()
+                return await intan_controller.set_count(req)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -113,8 +125,9 @@ class IntanReadCountTool(BaseTool):
         Use the tool to get the number of spike (of all electrodes) after triggers selected.
         """
         try:
-            intan_controller = IntanController()
-            return await intan_controller.read_count()
+            async with get_scheduler().acquire(Resource.Intan):
+                intan_controller = IntanController()
+                return await intan_controller.read_count()
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -128,6 +141,7 @@ class IntanSetTagTriggerTool(BaseTool):
     args_schema: Type[BaseModel] = SetTagTriggerRequest
     handle_tool_error = True
     handle_validation_error = True
+    registry: Optional[ControllerRegistry] = None
 
     def _run(self):
         return ""  # ! We need to implement this method to run the tool otherwise we're getting an error
@@ -141,8 +155,9 @@ class IntanSetTagTriggerTool(BaseTool):
         Use the tool to set tag to trigger. It will be store in the database with all triggers.
         """
         try:
-            intan_controller = IntanController()
-            return await intan_controller.set_tag_trigger(req)
+            async with get_scheduler().acquire(Resource.Intan):
+                controller = _intan(self.registry)
+                return await IntanController.set_tag_trigger(req, controller)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -154,6 +169,7 @@ class IntanSendStimParamTool(BaseTool):
     args_schema: Type[BaseModel] = StimParamRequest
     handle_tool_error = True
     handle_validation_error = True
+    registry: Optional[ControllerRegistry] = None
 
     def _run(self):
         return ""  # ! We need to implement this method to run the tool otherwise we're getting an error
@@ -167,8 +183,9 @@ class IntanSendStimParamTool(BaseTool):
         Use the tool to send a list of stim parameter to intan software.
         """
         try:
-            intan_controller = IntanController()
-            return await intan_controller.send_stimparam(req)
+            async with get_scheduler().acquire(Resource.Intan):
+                controller = _intan(self.registry)
+                return await IntanController.send_stimparam(req, controller)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -180,6 +197,7 @@ class IntanStartRawRecordingTool(BaseTool):
     args_schema: Type[BaseModel] = StartRawRecordingRequest
     handle_tool_error = True
     handle_validation_error = True
+    registry: Optional[ControllerRegistry] = None
 
     def _run(self):
         return ""  # ! We need to implement this method to run the tool otherwise we're getting an error
@@ -193,8 +211,9 @@ class IntanStartRawRecordingTool(BaseTool):
         Use the tool to start raw recording with the selected channels.
         """
         try:
-            intan_controller = IntanController()
-            return await intan_controller.start_raw_recording(req)
+            async with get_scheduler().acquire(Resource.Intan):
+                controller = _intan(self.registry)
+                return await IntanController.start_raw_recording(req, controller)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -206,6 +225,7 @@ class IntanStopRawRecordingTool(BaseTool):
     args_schema: Type[BaseModel] = BaseModel
     handle_tool_error = True
     handle_validation_error = True
+    registry: Optional[ControllerRegistry] = None
 
     def _run(self):
         return ""  # ! We need to implement this method to run the tool otherwise we're getting an error
@@ -218,8 +238,9 @@ class IntanStopRawRecordingTool(BaseTool):
         Use the tool to Stop raw recording.
         """
         try:
-            intan_controller = IntanController()
-            return await intan_controller.stop_raw_recording()
+            async with get_scheduler().acquire(Resource.Intan):
+                controller = _intan(self.registry)
+                return await IntanController.stop_raw_recording(controller)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -8,6 +8,8 @@ from langchain_core.tools import ToolException
 from pydantic import BaseModel
 
 from ..core.peristaltic import PeristalticController
+from ..core.pump_poller import PumpPoller
+from ..core.scheduler import get_scheduler, pump_resource
 from ..utils.schemas import (
     PeristalticRequest,
     PeristalticRpmRequest,
@@ -34,8 +36,9 @@ class PeristalticStarterTool(BaseTool):
         Use the tool to Start the peristaltic pump
         """
         try:
-            peristaltic_controller = PeristalticController(req.pump_id)
-            return await peristaltic_controller.start(req)
+            async with get_scheduler().acquire(pump_resource(req.pump_id)):
+                peristaltic_controller = PeristalticController(req.pump_id)
+                return await peristaltic_controller.start(req)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -60,8 +63,9 @@ class PeristalticStopperTool(BaseTool):
         Use the tool to Stop the peristaltic pump.
         """
         try:
-            peristaltic_controller = PeristalticController(req.pump_id)
-            return await peristaltic_controller.stop(req)
+            async with get_scheduler().acquire(pump_resource(req.pump_id)):
+                peristaltic_controller = PeristalticController(req.pump_id)
+                return await peristaltic_controller.stop(req)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -86,8 +90,9 @@ class PeristalticRPMTool(BaseTool):
         Use the tool to set RPM speed and direction of peristaltic pump.
         """
         try:
-            peristaltic_controller = PeristalticController(req.pump_id)
-            return await peristaltic_controller.rpm(req)
+            async with get_scheduler().acquire(pump_resource(req.pump_id)):
+                peristaltic_controller = PeristalticController(req.pump_id)
+                return await peristaltic_controller.rpm(req)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -99,6 +104,9 @@ class PeristalticInfoTool(BaseTool):
     args_schema = PeristalticRequest
     handle_tool_error = True
     handle_validation_error = True
+    # Latest state sampled in the background, the pump is queried if not set
+    # or if the sample is stale
+    poller: Optional[PumpPoller] = None
 
     def _run(self):
         return ""  # ! We need to implement this method to run the tool otherwise we're getting an error
@@ -112,6 +120,10 @@ class PeristalticInfoTool(BaseTool):
         Use the tool to get state of the peristaltic pump.
         """
         try:
+            if self.poller is not None and self.poller.running:
+                state = self.poller.latest(req.pump_id, self.poller.stale_after)
+                if state is not None:
+                    return state
             peristaltic_controller = PeristalticController(req.pump_id)
             return await peristaltic_controller.info(req)
         except Exception as e:
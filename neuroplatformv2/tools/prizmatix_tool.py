@@ -6,6 +6,8 @@ from langchain_core.tools import ToolException
 from pydantic import BaseModel
 
 from ..core.prizmatix import PrizmatixController
+from ..core.scheduler import get_scheduler
+from ..utils.enumerations import Resource
 
 
 class PrizmatixStarterTool(BaseTool):
@@ -26,8 +28,9 @@ class PrizmatixStarterTool(BaseTool):
         Start the Prizmatix UV led device
         """
         try:
-            prizmatix_controller = PrizmatixController()
-            return await prizmatix_controller.start()
+            async with get_scheduler().acquire(Resource.Prizmatix):
+                prizmatix_controller = PrizmatixController()
+                return await prizmatix_controller.start()
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
@@ -51,8 +54,9 @@ class PrizmatixStopperTool(BaseTool):
         Stops the Prizmatix UV led device
         """
         try:
-            prizmatix_controller = PrizmatixController()
-            return await prizmatix_controller.stop()
+            async with get_scheduler().acquire(Resource.Prizmatix):
+                prizmatix_controller = PrizmatixController()
+                return await prizmatix_controller.stop()
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
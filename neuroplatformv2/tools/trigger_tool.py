@@ -7,7 +7,9 @@ from langchain_core.callbacks.manager import (
 from langchain_core.tools import ToolException
 from pydantic import BaseModel
 
+from ..core.scheduler import get_scheduler
 from ..core.trigger import TriggerController
+from ..utils.enumerations import Resource
 from ..utils.schemas import TriggerPattern
 
 
@@ -30,8 +32,9 @@ class TriggerSenderTool(BaseTool):
         Use the tool to send a trigger pattern.
         """
         try:
-            trigger_controller = await TriggerController()
-            return await trigger_controller.trigger_sender(pattern)
+            async with get_scheduler().acquire(Resource.Intan, Resource.Trigger):
+                trigger_controller = await TriggerController()
+                return await trigger_controller.trigger_sender(pattern)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
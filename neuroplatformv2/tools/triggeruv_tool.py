@@ -5,7 +5,9 @@ from langchain_core.callbacks.manager import AsyncCallbackManagerForToolRun
 from langchain_core.tools import ToolException
 from pydantic import BaseModel
 
+from ..core.scheduler import get_scheduler
 from ..core.triggeruv import TriggerUVController
+from ..utils.enumerations import Resource
 from ..utils.schemas import TriggerUVSendRequest
 
 
@@ -28,8 +30,9 @@ class TriggerUVSenderTool(BaseTool):
         Use the tool to send a trigger uv pattern to activate the UV for a period of t
         """
         try:
-            trigger_controller = TriggerUVController()
-            return await trigger_controller.trigger_uv_send(req)
+            async with get_scheduler().acquire(Resource.TriggerUV):
+                trigger_controller = TriggerUVController()
+                return await trigger_controller.trigger_uv_send(req)
         except Exception as e:
             # Wrap any exception into a ToolException
             raise ToolException(str(e))
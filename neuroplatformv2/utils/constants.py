@@ -1,7 +1,13 @@
 import os
 
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+CAMERA_CACHE_DIR = os.getenv("CAMERA_CACHE_DIR", "")
+CAMERA_CACHE_MEMORY = int(os.getenv("CAMERA_CACHE_MEMORY", 256 * 1024 * 1024))
+CAMERA_CACHE_SIZE = int(os.getenv("CAMERA_CACHE_SIZE", 4 * 1024 * 1024 * 1024))
+CAMERA_DECODE_WORKERS = int(os.getenv("CAMERA_DECODE_WORKERS", 4))
 CAMERA_IP = os.getenv("CAMERA_IP", "172.30.1.43")
 CAMERA_PORT = int(os.getenv("CAMERA_PORT", 3005))
+DB_IMMUTABLE_DELAY = int(os.getenv("DB_IMMUTABLE_DELAY", 60))
 DB_IP = os.getenv("DB_IP", "172.30.2.215")
 DB_PORT = int(os.getenv("DB_PORT", 8088))
 DB_TIMEOUT = int(os.getenv("DB_TIMEOUT", 6000))
@@ -9,19 +15,47 @@ DB_TOKEN = os.getenv(
     "DB_TOKEN",
     "uBQYMh5To57O20MUJP_7hv84wQOiPNfC0Nrrdtj9b4vdovLf1DICVX1t15wpKsnOuqOhu2sEIsFWRnXf5r8dtQ==",
 )
+EXPERIMENT_LEASE = float(os.getenv("EXPERIMENT_LEASE", 300))
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", 8))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+HTTP_RETRY_DELAY = float(os.getenv("HTTP_RETRY_DELAY", 0.2))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+INTAN_HEALTH_INTERVAL = float(os.getenv("INTAN_HEALTH_INTERVAL", 1))
+INTAN_HEALTH_MAX_LOOP_MS = int(os.getenv("INTAN_HEALTH_MAX_LOOP_MS", 50))
+INTAN_HEALTH_MAX_RAW_QUEUE = float(os.getenv("INTAN_HEALTH_MAX_RAW_QUEUE", 0.8))
 INTAN_SOCK_TIMEOUT = float(os.getenv("INTAN_SOCK_TIMEOUT", 0.3))
 INTAN_SERVICE_IP = os.getenv("INTAN_SOFTWARE_IP", "172.30.1.165")
 INTAN_SERVICE_PORT = int(os.getenv("INTAN_SOFTWARE_PORT", 5051))
+MONGO_DB_CACHE_TTL = float(os.getenv("MONGO_DB_CACHE_TTL", 1.0))
 MONGO_DB_IP = os.getenv("MONGO_DB_IP", "172.30.1.43")
 MONGO_DB_PASSWORD = os.getenv("MONGO_DB_PASSWORD", "5YFXfZCnd6sKv7")
+MONGO_DB_POOL_SIZE = int(os.getenv("MONGO_DB_POOL_SIZE", 10))
 MONGO_DB_PORT = int(os.getenv("MONGO_DB_PORT", 27018))
 MONGO_DB_USER = os.getenv("MONGO_DB_USER", "npuser")
 PRIZMATIX_PORT = int(os.getenv("PRIZMATIX_PORT", 3001))
 PUMP_1_IP = os.getenv("PUMP_1_IP", "172.30.2.216")
 PUMP_2_IP = os.getenv("PUMP_2_IP", "172.30.2.131")
 PUMP_3_IP = os.getenv("PUMP_3_IP", "172.30.2.131")
+PUMP_POLL_HISTORY = int(os.getenv("PUMP_POLL_HISTORY", 3600))
+PUMP_POLL_INTERVAL = float(os.getenv("PUMP_POLL_INTERVAL", 1))
+PUMP_POLL_QUEUE = int(os.getenv("PUMP_POLL_QUEUE", 100))
 PUMP_PORT = int(os.getenv("PUMP_PORT", 3000))
+QUERY_CACHE_DIR = os.getenv("QUERY_CACHE_DIR", "")
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 256 * 1024 * 1024))
+RECORDING_DIR = os.getenv("RECORDING_DIR", "")
+RECORDING_MAX_BYTES = int(os.getenv("RECORDING_MAX_BYTES", 4 * 1024 * 1024 * 1024))
+RECORDING_MAX_DELAY = float(os.getenv("RECORDING_MAX_DELAY", 60))
+RECORDING_MAX_DURATION = float(os.getenv("RECORDING_MAX_DURATION", 3600))
+RECORDING_MIN_GAP = float(os.getenv("RECORDING_MIN_GAP", 1))
+RECORDING_SAMPLE_RATE = int(os.getenv("RECORDING_SAMPLE_RATE", 30000))
+SPIKE_HIGHPASS = float(os.getenv("SPIKE_HIGHPASS", 300))
+SPIKE_NOISE_BLOCK = int(os.getenv("SPIKE_NOISE_BLOCK", 3000))
+SPIKE_NOISE_HISTORY = int(os.getenv("SPIKE_NOISE_HISTORY", 100))
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", 200000))
+STREAM_CHUNK_SECONDS = float(os.getenv("STREAM_CHUNK_SECONDS", 60))
+TOOL_MAX_ROWS = int(os.getenv("TOOL_MAX_ROWS", 500))
 TRIGGER_IP = os.getenv("TRIGGER_IP", "172.30.1.165")
 TRIGGER_IP_PORT = os.getenv("TRIGGER_IP_PORT", 5010)
 TRIGGER_UV_PORT = int(os.getenv("TRIGGER_UV_PORT", 5002))
+TRIGGER_UV_SPIN = float(os.getenv("TRIGGER_UV_SPIN", 0.002))
 TRIGGER_UV_TIMEOUT = float(os.getenv("TRIGGER_UV_TIMEOUT", 0.3))
@@ -44,3 +44,47 @@ class PumpId(Enum):
     One = 1
     Two = 2
     Three = 3
+
+
+class AggregateFn(Enum):
+    """Reducer applied by the database to each time window"""
+
+    Mean = "mean"
+    Median = "median"
+    Sum = "sum"
+    Count = "count"
+    Min = "min"
+    Max = "max"
+    Quantile = "quantile"
+
+
+class SummaryMode(Enum):
+    """Form of the result of a database tool"""
+
+    Rows = "rows"
+    Counts = "counts"
+    Rates = "rates"
+    TopK = "top_k"
+    Downsampled = "downsampled"
+
+
+class Resource(Enum):
+    """Hardware resource locked by the scheduler, in the order of acquisition"""
+
+    Intan = "intan"
+    Trigger = "trigger"
+    TriggerUV = "trigger_uv"
+    Prizmatix = "prizmatix"
+    PumpOne = "pump_1"
+    PumpTwo = "pump_2"
+    PumpThree = "pump_3"
+    Camera = "camera"
+
+
+class IntanPort(Enum):
+    """Headstage port of the Intan board"""
+
+    A = 0
+    B = 1
+    C = 2
+    D = 3
@@ -68,3 +68,15 @@ class CameraReadingError(Exception):
     """Exception class for reading camera"""
 
     pass
+
+
+class HTTPRequestError(Exception):
+    """Exception when requesting an HTTP device"""
+
+    pass
+
+
+class IntanRecordingError(Exception):
+    """Exception when starting or stopping a raw recording"""
+
+    pass
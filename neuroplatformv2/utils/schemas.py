@@ -1,7 +1,8 @@
 from datetime import datetime
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
 
 import numpy as np
+import pandas as pd
 from pydantic import BaseModel, Field, ConfigDict
 
 from ..grpc.stimparam_pb2 import (
@@ -12,7 +13,17 @@ from ..grpc.stimparam_pb2 import (
     TriggerHighOrLow,
     PulseOrTrain,
 )
-from .enumerations import MEA, PeristalticDirection, PumpId, StimPolarity, StimShape
+from .constants import TOOL_MAX_ROWS
+from .enumerations import (
+    MEA,
+    AggregateFn,
+    IntanPort,
+    PeristalticDirection,
+    PumpId,
+    StimPolarity,
+    StimShape,
+    SummaryMode,
+)
 
 
 class TriggerPattern(BaseModel):
@@ -253,6 +264,34 @@ class StimParam(BaseModel):
                 print(f"{attr}: {getattr(self, attr)}")
 
 
+class StimParamBank(BaseModel):
+    """Stimulation parameters of several electrodes, with one row per electrode
+    in `array` (columns in the StimParam.to_array order)"""
+
+    index: List[int] = Field(..., description="Electrode indexes")
+    updated: List[Any] = Field(..., description="Last update time of each parameter")
+    stim_params: List[StimParam] = Field(..., description="Stimulation parameters")
+    array: np.ndarray = Field(..., description="(N, 20) float32 parameter array")
+
+    model_config = ConfigDict(
+        arbitrary_types_allowed=True,
+    )
+
+    @classmethod
+    def from_stim_params(
+        cls, stim_params: List[StimParam], updated: List[Any]
+    ) -> "StimParamBank":
+        array = np.empty((len(stim_params), 20), dtype=np.float32)
+        for row, sp in zip(array, stim_params):
+            row[:] = sp.to_array()
+        return cls(
+            index=[sp.index for sp in stim_params],
+            updated=updated,
+            stim_params=stim_params,
+            array=array,
+        )
+
+
 class VarThresholdRequest(BaseModel):
     """Request model for enabling/disabling auto variation threshold."""
 
@@ -289,6 +328,28 @@ class SetTagTriggerRequest(BaseModel):
     tag: int = Field(
         ...,
         description="Set tag to trigger. It will be store in the database with all triggers",
+        ge=0,
+        le=2**32 - 1,
+    )
+
+
+class TriggerTagsRequest(BaseModel):
+    """Request model for setting the tag of each trigger key."""
+
+    tags: List[int] = Field(
+        ...,
+        description="Tag of the trigger keys 0 to 15, stored with the triggers",
+        min_length=16,
+        max_length=16,
+    )
+
+
+class ExpNameRequest(BaseModel):
+    """Request model for setting the experiment name of the headstage ports."""
+
+    name: str = Field(..., description="Experiment name stored with the recordings")
+    ports: List[IntanPort] = Field(
+        default=list(IntanPort), description="Headstage ports to name"
     )
 
 
@@ -306,6 +367,19 @@ class UploadStimParamRequest(BaseModel):
     electrodes: List[int] = Field(..., description="List of electrodes")
 
 
+class StimParamUpdateResponse(BaseModel):
+    """Result of a stim parameter update: only the changed electrodes are uploaded"""
+
+    status: bool = Field(..., description="True if the update succeeded")
+    message: Optional[str] = Field(default=None, description="Error message")
+    changed: List[int] = Field(
+        default_factory=list, description="Electrodes sent and uploaded"
+    )
+    downtime: float = Field(
+        default=0.0, description="Duration of the upload to the headstage [s]"
+    )
+
+
 class CountDurationRequest(BaseModel):
     """Ask Intan the number of spike for the duration"""
 
@@ -320,6 +394,32 @@ class CountDurationResponse(BaseModel):
     )
 
 
+class RecordingEntry(BaseModel):
+    """One file of a rotated raw recording"""
+
+    tag: str = Field(..., description="File name tag of the recording")
+    start: datetime = Field(..., description="Start of the recording")
+    stop: datetime = Field(..., description="Stop of the recording")
+    channels: List[int] = Field(..., description="Recorded channels")
+
+
+class IntanHealthState(BaseModel):
+    """Last state of the Intan software sampled by the health monitor"""
+
+    ready: bool = Field(..., description="True if the board can take stimulations")
+    raw_queue: Optional[float] = Field(
+        default=None, description="Filling of the raw data queue"
+    )
+    loop_ms: Optional[int] = Field(
+        default=None, description="Duration of the acquisition loop [ms]"
+    )
+    latency: Optional[float] = Field(
+        default=None, description="Duration of the debuginfo call [s]"
+    )
+    updated: float = Field(..., description="Monotonic time of the sample [s]")
+    error: Optional[str] = Field(default=None, description="Error of the last call")
+
+
 class StartRawRecordingRequest(BaseModel):
     """Start raw recording with the selected channels"""
 
@@ -344,6 +444,14 @@ class TriggerUVSendRequest(BaseModel):
     t: int = Field(..., description="Activation period t of the UV", ge=1)
 
 
+class TriggerUVTrainRequest(BaseModel):
+    """Model for representing a train of UV pulses"""
+
+    t: int = Field(..., description="Activation period t of the UV", ge=1)
+    period: float = Field(..., description="Seconds between two pulses", gt=0)
+    count: int = Field(..., description="Number of pulses", ge=1)
+
+
 class SpikeEventQuery(BaseModel):
     start: datetime = Field(..., description="Start datetime for querying spike events")
     stop: datetime = Field(..., description="Stop datetime for querying spike events")
@@ -366,11 +474,90 @@ class SpikeCountQuery(BaseModel):
     fsname: str = Field(..., description="Name of the filesystem")
 
 
+class SpikeAggregateQuery(BaseModel):
+    start: datetime = Field(..., description="Start datetime of the aggregation")
+    stop: datetime = Field(..., description="Stop datetime of the aggregation")
+    fsname: str = Field(..., description="Name of the filesystem")
+    every: str = Field(
+        default="1m",
+        description="Window size as a Flux duration, e.g. 10s, 1m, 1h, 1d",
+        pattern=r"^\d+(ns|us|ms|s|m|h|d|w|mo|y)$",
+    )
+    fn: AggregateFn = Field(
+        default=AggregateFn.Mean, description="Reducer applied to each window"
+    )
+    quantile: float = Field(
+        default=0.5,
+        description="Quantile computed by the Quantile reducer",
+        ge=0,
+        le=1,
+    )
+
+
 class TriggersQuery(BaseModel):
     start: datetime = Field(..., description="Start datetime for querying triggers")
     stop: datetime = Field(..., description="Stop datetime for querying triggers")
 
 
+class TaggedTriggersQuery(TriggersQuery):
+    tag: int = Field(..., description="Tag set to the triggers when they were sent")
+
+
+class SummaryOptions(BaseModel):
+    """Options bounding the result of a database tool"""
+
+    mode: SummaryMode = Field(
+        default=SummaryMode.Rows,
+        description="rows: raw rows by pages, counts/rates: per channel, "
+        "top_k: most active channels, "
+        "downsampled: count and mean value per window and channel",
+    )
+    k: int = Field(default=10, description="Number of channels of top_k", ge=1)
+    every: str = Field(
+        default="1s",
+        description="Window of downsampled, e.g. 100ms, 1s, 1min, 1h",
+        pattern=r"^\d+(ms|s|min|h|d)$",
+    )
+    max_rows: int = Field(
+        default=TOOL_MAX_ROWS,
+        description="Maximum number of rows returned",
+        ge=1,
+        le=TOOL_MAX_ROWS,
+    )
+    cursor: Optional[str] = Field(
+        default=None, description="Cursor returned by the previous page, to continue"
+    )
+
+
+class SpikeEventSummaryQuery(SpikeEventQuery, SummaryOptions):
+    pass
+
+
+class RawSpikeSummaryQuery(RawSpikeQuery, SummaryOptions):
+    pass
+
+
+class SpikeCountSummaryQuery(SpikeCountQuery, SummaryOptions):
+    pass
+
+
+class TriggersSummaryQuery(TriggersQuery, SummaryOptions):
+    pass
+
+
+class DataPage(BaseModel):
+    """Bounded result of a database tool"""
+
+    data: pd.DataFrame = Field(..., description="Rows of the page")
+    cursor: Optional[str] = Field(
+        default=None, description="Cursor of the next page, None if it is the last"
+    )
+
+    model_config = ConfigDict(
+        arbitrary_types_allowed=True,
+    )
+
+
 class PeristalticState(BaseModel):
     rpm: float = Field(
         ...,
@@ -429,8 +616,6 @@ class PeristalticRequest(BaseModel):
     pump_id: PumpId = Field(
         ...,
         description="Id of the pump to be selected from the set {1,2,3}",
-        ge=1,
-        le=3,
     )
 
 
@@ -439,14 +624,18 @@ class PeristalticRpmRequest(BaseModel):
     direction: PeristalticDirection = Field(
         ...,
         description="PeristalticDirection 0=CounterClockWise, 1=ClockWise",
-        ge=0,
-        le=1,
     )
     pump_id: PumpId = Field(
         ...,
         description="Id of the pump to be selected from the set {1,2,3}",
-        ge=1,
-        le=3,
+    )
+
+
+class PeristalticRpmAllRequest(BaseModel):
+    speed: float = Field(..., description="speed of the three pumps")
+    direction: PeristalticDirection = Field(
+        ...,
+        description="PeristalticDirection 0=CounterClockWise, 1=ClockWise",
     )
 
 
@@ -463,11 +652,26 @@ class ExperimentStimParamRequest(BaseModel):
     index_electrode: int = Field(..., description="Index electrode.")
 
 
+class ExperimentStimParamsRequest(BaseModel):
+    token: str = Field(
+        ..., description="The unique token string identifying the experiment."
+    )
+    electrodes: Optional[List[int]] = Field(
+        default=None,
+        description="Index electrodes, all the electrodes of the experiment by default.",
+    )
+
+
 class CameraFromRequest(BaseModel):
     mea: MEA = Field(..., description="Mea Number")
     img_id: str = Field(..., description="Id of the image")
 
 
+class CameraImagesRequest(BaseModel):
+    mea: MEA = Field(..., description="Mea Number")
+    img_ids: List[str] = Field(..., description="Ids of the images")
+
+
 class CameraListImagesRequest(BaseModel):
     mea: MEA = Field(..., description="Mea Number")
     start_date: Union[str, datetime] = Field(
@@ -478,5 +682,32 @@ class CameraListImagesRequest(BaseModel):
     )
 
 
+class CameraNewImagesRequest(BaseModel):
+    mea: MEA = Field(..., description="Mea Number")
+    since: Union[str, datetime] = Field(
+        ..., description="Start date of the first listing of the MEA"
+    )
+
+
 class CameraCaptureRequest(BaseModel):
     mea: MEA = Field(..., description="Mea Number")
+
+
+class TimelapseRequest(BaseModel):
+    mea: MEA = Field(..., description="Mea Number")
+    start_date: Union[str, datetime] = Field(
+        ..., description="Start date of the timelapse"
+    )
+    end_date: Union[str, datetime] = Field(..., description="End date of the timelapse")
+    path: str = Field(..., description="Directory of the timelapse store")
+    scale: Literal[1, 2, 4, 8] = Field(
+        default=4, description="Resolution reduction factor applied when decoding"
+    )
+    grayscale: bool = Field(default=False, description="Decode in grayscale")
+    roi: Optional[Tuple[int, int, int, int]] = Field(
+        default=None,
+        description="Region of interest (x, y, width, height) in full resolution pixels",
+    )
+    chunk_size: int = Field(
+        default=32, description="Number of frames per stored chunk", ge=1
+    )
@@ -1,3 +1,4 @@
+from contextlib import AsyncExitStack
 from datetime import timedelta, datetime, timezone
 import numpy as np
 import time
@@ -11,7 +12,10 @@ from neuroplatformv2.core.database import (
     get_raw_spike,
 )
 from neuroplatformv2.core.intan import IntanController
+from neuroplatformv2.core.scheduler import get_scheduler
+from neuroplatformv2.utils.enumerations import IntanPort, Resource
 from neuroplatformv2.utils.schemas import (
+    CountDurationRequest,
     StimParam,
     StimPolarity,
     StartRawRecordingRequest,
@@ -143,7 +147,7 @@ class AttentionOrganoid(OrganoidProcessor):
 
 
 class OrganoidSystem:
-    def __init__(self):
+    def __init__(self, readout="database", health=None, recording=None):
         # Initialize organoid processors
         self.organoids = [
             EmotionalOrganoid(),
@@ -164,6 +168,18 @@ class OrganoidSystem:
             3: {'method': 'bernoulli', 'electrodes': list(range(8))}
         }
 
+        # Spike readout: "database" polls InfluxDB after the triggers,
+        # "count" arms the Intan count window right after the triggers
+        if readout not in ("database", "count"):
+            raise ValueError(f"Unknown readout mode: {readout}")
+        self.readout = readout
+
+        # Optional IntanHealthMonitor: stimulation is skipped while the board is not ready
+        self.health = health
+
+        # Optional RecordingSession: its files are not rotated during a burst
+        self.recording = recording
+
         # Flag to track initialization
         self.is_initialized = False
 
@@ -205,17 +221,17 @@ class OrganoidSystem:
         # Create standard stim params
         standard_stim_params = self.create_standard_stim_params()
 
-        # Send standard stimulation parameters
-        resp = await self.intan._send_stimparam(standard_stim_params)
+        # Send and upload the standard stimulation parameters that are not loaded yet.
+        # The upload stops the board: no trigger or rotation may happen meanwhile
+        async with get_scheduler().acquire(Resource.Intan, Resource.Trigger):
+            resp = await self.intan._update_stimparam(standard_stim_params)
         if not resp.status:
             print(f"Error updating standard stim parameters: {resp.message}")
             return False
-
-        # Upload standard stim parameters
-        resp = await self.intan._upload_stimparam()
-        if not resp.status:
-            print(f"Error uploading standard stim parameters: {resp.message}")
-            return False
+        print(
+            f"Uploaded {len(resp.changed)} stim parameters, "
+            f"board down for {resp.downtime:.2f}s"
+        )
 
         # Mark as initialized
         self.is_initialized = True
@@ -283,20 +299,121 @@ class OrganoidSystem:
 
         return trigger_values
 
-    async def send_triggers(self, trigger_values):
+    async def send_triggers(self, trigger_values, ready_timeout=2, label=None):
         """
         Send the computed triggers one by one
+
+        If `label` is set (e.g. the tweet id), the triggers are tagged with
+        `tag_from_label(label)` and the recordings named `label`, so the evoked data
+        can be queried by tag with `DatabaseController.get_tagged_triggers`.
+        The tags are reset after the burst, as they persist on the board
+
+        Returns:
+        bool: False if the board was not ready within `ready_timeout` seconds
+        and nothing was sent
         """
-        for i in np.arange(16):
-            if trigger_values[i]==1:
-                triggers = np.zeros(16, dtype=np.uint8)
-                triggers[i] = 1
-                await self.trigger.send(triggers)
-                time.sleep(0.5)
+        if self.health is not None and not await self.health.wait_ready(ready_timeout):
+            print(f"Intan not ready, stimulation skipped: {self.health.metrics()}")
+            return False
 
+        # The Intan and trigger locks keep tool calls and recording rotations
+        # out of the burst
+        async with get_scheduler().acquire(Resource.Intan, Resource.Trigger):
+            async with self._stimulation():
+                await self._send_burst(trigger_values, label)
+        return True
+
+    def _stimulation(self):
+        """Stimulation block of the recording session, if any"""
+        if self.recording is None:
+            return AsyncExitStack()
+        return self.recording.stimulation()
+
+    async def _send_burst(self, trigger_values, label):
+        if label is not None:
+            resp = await self.intan._tag(str(label), list(IntanPort))
+            if not resp.status:
+                print(f"Error tagging the triggers: {resp.message}")
+
+        try:
+            for i in np.arange(16):
+                if trigger_values[i]==1:
+                    triggers = np.zeros(16, dtype=np.uint8)
+                    triggers[i] = 1
+                    await self.trigger.send(triggers)
+                    time.sleep(0.5)
+        finally:
+            if label is not None:
+                resp = await self.intan._untag(list(IntanPort))
+                if not resp.status:
+                    print(f"Error resetting the trigger tags: {resp.message}")
+
+
+    async def count_spikes(self, seconds=5):
+        """
+        Count the spikes of all electrodes during the next `seconds` with the Intan count RPC
+
+        Returns:
+        np.ndarray: spike count of the 128 electrodes
+        """
+        req = CountDurationRequest(duration=int(seconds * 1000))
+        counts = await self.intan._count_spike(req.duration)
+        return np.asarray(counts, dtype=np.int64)
+
+    def summarize_spike_counts(self, counts):
+        """
+        Reduce a 128-element spike count vector into the 4x8 organoid summary
+        """
+        # 8 electrodes per organoid, organoids are on the first 32 electrodes
+        counts = np.asarray(counts, dtype=np.int64)
+        if counts.size < 32:
+            raise ValueError(
+                f"Count readout returned {counts.size} values, expected at least 32"
+            )
+        per_channel = counts[:32].reshape(4, 8)
+        per_organoid = per_channel.sum(axis=1)
+        active = (per_channel > 0).sum(axis=1)
+
+        activity_summary = {
+            'total_spikes': int(per_organoid.sum()),
+            'active_channels': int(active.sum()),
+            # The count RPC does not report amplitudes
+            'max_amplitude': None,
+            'organoid_states': []
+        }
+        for organoid in range(4):
+            organoid_activity = int(per_organoid[organoid])
+            activity_summary['organoid_states'].append({
+                'id': organoid + 1,
+                'activity_level': 'high' if organoid_activity > 1000 else 'medium' if organoid_activity > 100 else 'low',
+                'active_channels': int(active[organoid]),
+                'max_amplitude': None
+            })
+
+        return activity_summary
+
+    async def stimulate(self, trigger_values, seconds=5, label=None):
+        """
+        Send the triggers and read the organoid response with the configured readout.
+        Returns None if the board was not ready and nothing was sent
+        """
+        # The response window is part of the stimulation for the recording rotation
+        async with self._stimulation():
+            if not await self.send_triggers(trigger_values, label=label):
+                return None
+            return await self.get_organoid_status(seconds=seconds)
 
     async def get_organoid_status(self, seconds=5):
-        """Analyze recent organoid activity and return a context summary"""
+        """Analyze organoid activity and return a context summary
+
+        With the "count" readout, spikes are counted during the next `seconds`,
+        so call it right after `send_triggers`. With the "database" readout,
+        the last `seconds` are queried from InfluxDB.
+        """
+        if self.readout == "count":
+            counts = await self.count_spikes(seconds=seconds)
+            return self.summarize_spike_counts(counts)
+
         now = datetime.now(timezone.utc)
         activity_summary = {
             'total_spikes': 0,